@@ -0,0 +1,85 @@
+"""Compares the flat and sharded layouts of the local storage
+
+Creates the same number of empty files in a flat and in sharded
+directories, then times:
+    - index: building the PostIDIndex of the directory, the listing done
+      once per run by meme_exists
+    - walk: listing every file, like a backup or rsync does
+    - lookup: finding the file of a post without an index, with a glob
+
+Usage:
+    python benchmarks/storage_layout.py --files 100000 --levels 1 2
+"""
+
+import os
+import glob
+import time
+import logging
+import random
+import argparse
+import tempfile
+from typing import Callable, List
+
+from ninegag_notion_scraper.infra.repo.meme_filestorage import PostIDIndex
+from ninegag_notion_scraper.infra.repo.storage_layout import StorageLayout
+
+
+# the package logs every index build at debug level
+logging.getLogger('app').setLevel(logging.INFO)
+
+
+def populate(root: str, layout: StorageLayout, post_ids: List[str]) -> None:
+    for post_id in post_ids:
+        directory = layout.directory(root, post_id)
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, f"{post_id}.mp4"), 'w').close()
+
+
+def timed(func: Callable[[], object], repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def walk(root: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(root))
+
+
+def lookup(root: str, layout: StorageLayout, post_ids: List[str]) -> None:
+    for post_id in post_ids:
+        directory = layout.directory(root, post_id)
+        assert glob.glob(os.path.join(glob.escape(directory), f"{post_id}.*"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--levels", type=int, nargs='+', default=[1, 2])
+    parser.add_argument("--lookups", type=int, default=100)
+    args = parser.parse_args()
+
+    post_ids = [f"a{x:07d}" for x in range(args.files)]
+    sample = random.sample(post_ids, args.lookups)
+
+    print(f"{args.files} files, {args.lookups} lookups")
+    print(f"{'levels':>6} {'index':>9} {'walk':>9} {'lookup':>9}")
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        for levels in [0] + args.levels:
+            layout = StorageLayout(levels)
+            root = os.path.join(temp_directory, f"levels-{levels}")
+            populate(root, layout, post_ids)
+
+            index_time = timed(lambda: PostIDIndex.build(root, layout))
+            walk_time = timed(lambda: walk(root))
+            lookup_time = timed(lambda: lookup(root, layout, sample))
+
+            print(f"{levels:>6} {index_time:>8.3f}s {walk_time:>8.3f}s "
+                  f"{lookup_time / args.lookups * 1000:>7.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
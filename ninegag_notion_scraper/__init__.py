@@ -1,7 +1,10 @@
 import os
+import time
 import logging
 from dotenv import load_dotenv
 
+START_TIME = time.perf_counter()
+
 logger = logging.getLogger('app')
 logger.setLevel(logging.DEBUG)
 
@@ -1,87 +1,229 @@
 """The main function"""
 
+import time
 import logging
-from typing import Callable
-from notion_client import Client as NotionClient
-from selenium.webdriver.remote.webdriver import WebDriver
+from contextlib import nullcontext
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Generator, Iterable, \
+    Iterator, List, Tuple
 
 from ninegag_notion_scraper.app.use_cases.meme import GetDBMemes, \
     GetPostMeme, GetPostMemes, SavePostMeme, UpdateMeme
-from ninegag_notion_scraper.infra.repo.meme_ninegag_scraper.page_single \
-    import Meme404, NineGagSinglePageScraperRepo
-from ninegag_notion_scraper.infra.repo.meme_notion.get_memes \
-    import NotionGetMemes
 
 # Setup tools
+from . import START_TIME
 from .env import Environments, get_envs
 from .args import Arguments, get_args
 
-from .infra.webdriver import get_webbrowser_brave
-from .app.entities.meme import PostMeme
+from .app.entities.meme import DBMeme, PostMeme
 from .app.use_cases.cookies import CookiesUseCase
 from .infra.repo.cookie_filestorage \
     import FileCookiesRepo
-from .infra.repo.meme_ninegag_scraper import NineGagStreamScraperRepo
-from .infra.repo.meme_notion import NotionSaveMeme
-from .infra.repo.meme_filestorage import FileStorageRepo
+from .pipeline import Pipeline
+from .backfill import ParallelBackfill
+
+# selenium and notion_client are slow to import, they are only imported
+# once a mode needs them
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+    from ninegag_notion_scraper.infra.repo.meme_ninegag_scraper \
+        .page_single import NineGagSinglePageScraperRepo
 
 logger = logging.getLogger('app')
 
 
 def main(args: Arguments, envs: Environments,
-         get_webdriver: Callable[[], WebDriver]) -> None:
+         get_webdriver: Callable[[], 'WebDriver']) -> None:
     """The entry point to the application"""
+    from notion_client import AsyncClient as NotionAsyncClient, \
+        Client as NotionClient
+    from .infra.repo.meme_ninegag_scraper import NineGagStreamScraperRepo, \
+        NineGagFeedHTTPRepo
+    from .infra.repo.meme_ninegag_scraper.page_single \
+        import NineGagSinglePageScraperRepo
+    from .infra.repo.meme_ninegag_scraper.variants import VariantSelector
+    from .infra.repo.meme_notion import NotionSaveMeme
+    from .infra.repo.meme_notion.get_memes import NotionGetMemes
+    from .infra.repo.meme_notion.mirror import NotionMirror, \
+        NotionMirrorGetMemes
+    from .infra.repo.meme_notion.async_repo import AsyncNotionGetMemes, \
+        AsyncNotionSaveMeme
+    from .infra.repo.meme_notion.budget import RequestBudget
+    from .infra.repo.meme_notion.retry_policy import NotionRetryPolicy
+    from .infra.repo.meme_notion.write_behind import NotionWriteBehind
+    from .infra.repo.meme_filestorage import FileStorageRepo
+    from .infra.repo.meme_filestorage_async import AsyncFileStorageRepo
+    from .infra.repo.storage_layout import StorageLayout
+    from .infra.repo.download_policy import DownloadPolicy
+    from .infra.repo.storage_manifest import StorageManifest
+    from .infra.http_client import HTTPClients
+
+    logger.debug(f"Modules loaded {time.perf_counter() - START_TIME:.3f}s "
+                 "after start")
+
+    cookie_usecase = CookiesUseCase(FileCookiesRepo(envs.COOKIES_PATH))
+    reuse_session = envs.BROWSER_DEBUGGER_ADDRESS is not None
+    layout = StorageLayout(envs.STORAGE_SHARD_LEVELS)
+
+    # one connection pool for every request made without the browser, its
+    # cookies follow the ones saved by the browser
+    clients = HTTPClients(cookie_usecase.get_cookies,
+                          max_connections=args.download_concurrency)
+    cookie_usecase.on_save(clients.set_cookies)
+
+    variant_selector = VariantSelector(policy=args.media_variant,
+                                       codec_order=args.codec_order,
+                                       clients=clients)
+
+    # every notion request, sync or async, goes through it
+    notion_policy = NotionRetryPolicy(
+        budget=RequestBudget(args.notion_rps))
+    notion_client = NotionClient(auth=envs.NOTION_TOKEN)
+    notion_mirror = None
+    if envs.NOTION_MIRROR_PATH:
+        notion_mirror = NotionMirror(notion_client, envs.NOTION_DATABASE,
+                                     envs.NOTION_MIRROR_PATH,
+                                     policy=notion_policy)
+        notion_mirror.sync(full=args.full_notion_sync)
+    # closed after the notion repos using it
+    mirror_context = notion_mirror or nullcontext()
+
+    def get_notion_save() -> NotionSaveMeme | AsyncNotionSaveMeme | \
+            NotionWriteBehind:
+        if envs.NOTION_JOURNAL_PATH:
+            if args.async_notion:
+                logger.warning("NOTION_JOURNAL_PATH is set, the pages are "
+                               "saved by the journal instead of "
+                               "--async-notion")
+            return NotionWriteBehind(
+                NotionSaveMeme(notion_client, envs.NOTION_DATABASE,
+                               mirror=notion_mirror, policy=notion_policy),
+                envs.NOTION_JOURNAL_PATH)
+        if args.async_notion:
+            return AsyncNotionSaveMeme(
+                notion_client,
+                NotionAsyncClient(auth=envs.NOTION_TOKEN),
+                envs.NOTION_DATABASE,
+                policy=notion_policy,
+                mirror=notion_mirror
+            )
+        return NotionSaveMeme(notion_client, envs.NOTION_DATABASE,
+                              mirror=notion_mirror, policy=notion_policy)
+
+    def get_file_storage() -> FileStorageRepo | AsyncFileStorageRepo:
+        policy = DownloadPolicy(rate=args.download_rate,
+                                metrics_path=envs.DOWNLOAD_METRICS_PATH)
+        manifest = StorageManifest(envs.STORAGE_MANIFEST_PATH) \
+            if envs.STORAGE_MANIFEST_PATH else None
+        if args.async_downloads:
+            return AsyncFileStorageRepo(
+                covers_path=envs.COVERS_PATH,
+                memes_path=envs.MEMES_PATH,
+                _selenium_cookies_func=cookie_usecase.get_cookies,
+                max_concurrency=args.download_concurrency,
+                index_cache_path=envs.STORAGE_INDEX_PATH,
+                blobs_path=envs.BLOBS_PATH,
+                layout=layout,
+                policy=policy,
+                manifest=manifest,
+                clients=clients
+            )
+        return FileStorageRepo(
+            covers_path=envs.COVERS_PATH,
+            memes_path=envs.MEMES_PATH,
+            _selenium_cookies_func=cookie_usecase.get_cookies,
+            index_cache_path=envs.STORAGE_INDEX_PATH,
+            blobs_path=envs.BLOBS_PATH,
+            layout=layout,
+            policy=policy,
+            manifest=manifest,
+            clients=clients
+        )
+
+    if args.save_notion_meme_locally:
+        notion_get: NotionGetMemes | NotionMirrorGetMemes | \
+            AsyncNotionGetMemes
+        if notion_mirror:
+            notion_get = NotionMirrorGetMemes(notion_mirror)
+        elif args.async_notion:
+            notion_get = AsyncNotionGetMemes(
+                notion_client, NotionAsyncClient(auth=envs.NOTION_TOKEN),
+                envs.NOTION_DATABASE, policy=notion_policy)
+        else:
+            notion_get = NotionGetMemes(notion_client, envs.NOTION_DATABASE,
+                                        policy=notion_policy)
+        notion_update = get_notion_save()
+        file_storage = get_file_storage()
+
+        def get_ninegag() -> NineGagSinglePageScraperRepo:
+            return NineGagSinglePageScraperRepo(
+                envs.NINEGAG_USERNAME,
+                envs.NINEGAG_PASSWORD,
+                get_webdriver(),
+                cookie_usecase,
+                reuse_session=reuse_session,
+                variant_selector=variant_selector
+            )
 
-    webdriver = get_webdriver()
+        if args.workers > 1 and reuse_session:
+            logger.warning("Workers can't share the attached browser, "
+                           "running with a single worker")
+
+        with clients, notion_policy, mirror_context, file_storage, \
+                notion_update:
+            if args.workers > 1 and not reuse_session:
+                memes_from_notion_to_save_locally_parallel(
+                    notion_get=GetDBMemes(notion_get),
+                    notion_update=UpdateMeme(notion_update),
+                    file_storage=SavePostMeme(file_storage),
+                    get_ninegag=get_ninegag,
+                    args=args
+                )
+                return
+
+            with get_ninegag() as ninegag:
+                memes_from_notion_to_save_locally(
+                    notion_get=GetDBMemes(notion_get),
+                    notion_update=UpdateMeme(notion_update),
+                    file_storage=SavePostMeme(file_storage),
+                    ninegag=GetPostMeme(ninegag),
+                    args=args
+                )
+        return
 
-    cookie_usecase = CookiesUseCase(FileCookiesRepo())
+    ninegag_scraper_repo: NineGagStreamScraperRepo | NineGagFeedHTTPRepo
 
-    if args.save_notion_meme_locally:
-        notion_client = NotionClient(auth=envs.NOTION_TOKEN)
-        notion_get = NotionGetMemes(notion_client, envs.NOTION_DATABASE)
-        notion_update = NotionSaveMeme(notion_client, envs.NOTION_DATABASE)
-        file_storage = FileStorageRepo(
-            covers_path=envs.COVERS_PATH,
-            memes_path=envs.MEMES_PATH,
-            _selenium_cookies_func=cookie_usecase.get_cookies
+    if args.http_stream:
+        ninegag_scraper_repo = NineGagFeedHTTPRepo(
+            envs.NINEGAG_URL,
+            cookie_usecase,
+            variant_selector=variant_selector,
+            clients=clients
         )
-        ninegag = NineGagSinglePageScraperRepo(
+    else:
+        ninegag_scraper_repo = NineGagStreamScraperRepo(
+            envs.NINEGAG_URL,
             envs.NINEGAG_USERNAME,
             envs.NINEGAG_PASSWORD,
-            webdriver,
-            cookie_usecase
+            get_webdriver(),
+            cookie_usecase,
+            reuse_session=reuse_session,
+            prune_streams=args.prune_streams,
+            measure_dom=args.measure_dom,
+            variant_selector=variant_selector
         )
-        with ninegag:
-            memes_from_notion_to_save_locally(
-                notion_get=GetDBMemes(notion_get),
-                notion_update=UpdateMeme(notion_update),
-                file_storage=SavePostMeme(file_storage),
-                ninegag=GetPostMeme(ninegag),
-                args=args
-            )
-        return
 
-    ninegag_scraper_repo = NineGagStreamScraperRepo(
-        envs.NINEGAG_URL,
-        envs.NINEGAG_USERNAME,
-        envs.NINEGAG_PASSWORD,
-        webdriver,
-        cookie_usecase
-    )
+    notion_storage_repo = get_notion_save()
 
-    notion_storage_repo = NotionSaveMeme(NotionClient(
-        auth=envs.NOTION_TOKEN), envs.NOTION_DATABASE
-    )
+    filestorage_repo = get_file_storage()
 
-    filestorage_repo = FileStorageRepo(
-        covers_path=envs.COVERS_PATH,
-        memes_path=envs.MEMES_PATH,
-        _selenium_cookies_func=cookie_usecase.get_cookies
-    )
+    flow = memes_from_9gag_to_notion_pipelined if args.pipeline \
+        else memes_from_9gag_to_notion_with_local_save
 
-    with ninegag_scraper_repo:
+    with clients, notion_policy, mirror_context, ninegag_scraper_repo, \
+            filestorage_repo, notion_storage_repo:
 
-        memes_from_9gag_to_notion_with_local_save(
+        flow(
             ninegag=GetPostMemes(ninegag_scraper_repo),
             notion=SavePostMeme(notion_storage_repo),
             file_storage=SavePostMeme(filestorage_repo),
@@ -93,26 +235,97 @@ class StopLoopException(Exception):
     pass
 
 
+NOT_MEME404_FILTER = {
+    "property": "Tags",
+    "multi_select": {
+        "does_not_contain": "Meme404"
+    }
+}
+
+
 def memes_from_9gag_to_notion_with_local_save(
         ninegag: GetPostMemes,
         notion: SavePostMeme,
         file_storage: SavePostMeme,
         args: Arguments) -> None:
+    """Saves the memes of each scraped batch, the files of a batch are
+    downloaded concurrently before their notion pages are saved"""
 
-    for memes in ninegag.get_memes():
-        try:
-            for meme in memes:
-                evaluate_storage(args, meme, file_storage)
-                evaluate_storage(args, meme, notion)
-
-        except StopLoopException:
-            logger.debug("Loop stopped by evaluate_storage")
-            break
+    for plans in plan_saves(args, ninegag.get_memes(), file_storage,
+                            notion):
+        file_storage.save_memes([meme for meme, save_file, _ in plans
+                                 if save_file])
+        for meme, _, save_notion in plans:
+            if save_notion:
+                notion.save_meme(meme)
 
 
-def evaluate_storage(args: Arguments,
-                     meme: PostMeme,
-                     storage: SavePostMeme):
+def memes_from_9gag_to_notion_pipelined(
+        ninegag: GetPostMemes,
+        notion: SavePostMeme,
+        file_storage: SavePostMeme,
+        args: Arguments) -> None:
+    """Same as memes_from_9gag_to_notion_with_local_save, but scraping,
+    local saving and saving to notion run concurrently
+
+    Both existence checks run in the producer, so the stages only get the
+    saves the serial loop would have made and stop where it would have
+    stopped, whatever their lead"""
+
+    def save_file(item: Tuple[PostMeme, bool, bool]) -> bool:
+        if item[1]:
+            file_storage.save_meme(item[0])
+        return True
+
+    def save_notion(item: Tuple[PostMeme, bool, bool]) -> bool:
+        if item[2]:
+            notion.save_meme(item[0])
+        return True
+
+    Pipeline(
+        producer=plan_saves(args, ninegag.get_memes(), file_storage,
+                            notion),
+        stages=[
+            ("file_storage", save_file),
+            ("notion", save_notion),
+        ],
+        queue_size=args.queue_size
+    ).run()
+
+
+def plan_saves(args: Arguments,
+               batches: Iterable[List[PostMeme]],
+               file_storage: SavePostMeme,
+               notion: SavePostMeme
+               ) -> Iterator[List[Tuple[PostMeme, bool, bool]]]:
+    """Checks each meme against file_storage then notion, in order, and
+    yields the batches as (meme, save_file, save_notion). Stops after the
+    meme an existing one stops the loop at, its file is still saved when
+    notion is the one stopping"""
+    for memes in batches:
+        plans: List[Tuple[PostMeme, bool, bool]] = []
+        for meme in memes:
+            try:
+                save_file = should_save(args, meme, file_storage)
+            except StopLoopException:
+                logger.debug("Loop stopped by 'file_storage'")
+                yield plans
+                return
+            try:
+                save_notion = should_save(args, meme, notion)
+            except StopLoopException:
+                logger.debug("Loop stopped by 'notion'")
+                yield plans + [(meme, save_file, False)]
+                return
+            plans.append((meme, save_file, save_notion))
+        yield plans
+
+
+def should_save(args: Arguments,
+                meme: PostMeme,
+                storage: SavePostMeme) -> bool:
+    """Whether meme has to be saved to storage, raises StopLoopException
+    when the loop has to stop at it"""
 
     exists = storage.meme_exists(meme)
 
@@ -120,12 +333,20 @@ def evaluate_storage(args: Arguments,
         logger.info(f"Meme ID {meme.post_id} was skipped "
                     f"in '{storage.__class__.__name__}' because it "
                     "already exists")
-        return
+        return False
 
     if not args.ignore_existing and exists:
         raise StopLoopException  # stop the outer loop
 
-    storage.save_meme(meme)
+    return True
+
+
+def evaluate_storage(args: Arguments,
+                     meme: PostMeme,
+                     storage: SavePostMeme):
+
+    if should_save(args, meme, storage):
+        storage.save_meme(meme)
 
 
 def memes_from_notion_to_save_locally(
@@ -135,15 +356,9 @@ def memes_from_notion_to_save_locally(
         ninegag: GetPostMeme,
         args: Arguments
 ):
+    from .infra.repo.meme_ninegag_scraper.page_single import Meme404
 
-    filter = {
-        "property": "Tags",
-        "multi_select": {
-            "does_not_contain": "Meme404"
-        }
-    }
-
-    for memes in notion_get.get_memes(filter=filter):
+    for memes in notion_get.get_memes(filter=NOT_MEME404_FILTER):
         try:
             for meme in memes:
                 if not file_storage.meme_exists(meme):
@@ -166,6 +381,41 @@ def memes_from_notion_to_save_locally(
             logger.debug("Loop stopped by evaluate_storage")
 
 
+def memes_from_notion_to_save_locally_parallel(
+        notion_get: GetDBMemes,
+        notion_update: UpdateMeme,
+        file_storage: SavePostMeme,
+        get_ninegag: Callable[[], 'NineGagSinglePageScraperRepo'],
+        args: Arguments
+):
+    """Same as memes_from_notion_to_save_locally, but args.workers single
+    page scrapers, each with its own browser, fetch the memes concurrently"""
+    from .infra.repo.meme_ninegag_scraper.page_single import Meme404
+
+    def missing_locally() -> Generator[DBMeme, None, None]:
+        for memes in notion_get.get_memes(filter=NOT_MEME404_FILTER):
+            for meme in memes:
+                if file_storage.meme_exists(meme):
+                    logger.info(f"Meme {meme.post_id} already exists")
+                    continue
+                logger.info(f"Meme {meme.post_id} doesn't exists locally")
+                yield meme
+
+    def save(meme: PostMeme) -> None:
+        try:
+            evaluate_storage(args, meme, file_storage)
+        except StopLoopException:
+            logger.debug(f"Meme {meme.post_id} was saved by another worker")
+
+    ParallelBackfill(
+        get_scraper=get_ninegag,
+        save=save,
+        notion_update=notion_update,
+        missing_exception=Meme404,
+        workers=args.workers
+    ).run(missing_locally())
+
+
 if __name__ == '__main__':
     args = get_args()
     envs = get_envs()
@@ -175,4 +425,29 @@ if __name__ == '__main__':
         debug(args, envs)
         quit()
 
-    main(args=args, envs=envs, get_webdriver=get_webbrowser_brave)
+    if args.dedup_storage:
+        from .dedup import main as dedup
+        dedup(args, envs)
+        quit()
+
+    if args.reshard_storage:
+        from .reshard import main as reshard
+        reshard(args, envs)
+        quit()
+
+    if args.verify_storage:
+        from .verify import main as verify
+        verify(args, envs)
+        quit()
+
+    from .infra.webdriver import get_webbrowser_brave, \
+        get_webdriver_attached, get_webdriver_low_bandwidth
+
+    get_webdriver: Callable[[], 'WebDriver'] = get_webbrowser_brave
+    if args.low_bandwidth:
+        get_webdriver = get_webdriver_low_bandwidth
+    if envs.BROWSER_DEBUGGER_ADDRESS:
+        get_webdriver = partial(get_webdriver_attached,
+                                envs.BROWSER_DEBUGGER_ADDRESS)
+
+    main(args=args, envs=envs, get_webdriver=get_webdriver)
@@ -14,5 +14,17 @@ class SaveCookiesRepo(ABC):
         raise NotImplementedError
 
 
-class CookieRepo(GetCookiesRepo, SaveCookiesRepo):
+class SessionStateRepo(ABC):
+    @abstractmethod
+    def mark_validated(self) -> None:
+        """Records that the saved cookies were just seen logged in"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_session_known_good(self) -> bool:
+        """Whether the saved cookies can be trusted without checking"""
+        raise NotImplementedError
+
+
+class CookieRepo(GetCookiesRepo, SaveCookiesRepo, SessionStateRepo):
     pass
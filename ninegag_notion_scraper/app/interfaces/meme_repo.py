@@ -47,6 +47,10 @@ class SaveMemeRepo(ABC):
                   ) -> None:
         ...
 
+    def save_memes(self, memes: List[PostMeme]) -> None:
+        for meme in memes:
+            self.save_meme(meme)
+
     @abstractmethod
     def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
         ...
@@ -58,6 +62,14 @@ class GetMemeRepo(ABC):
     def get_meme_from_url(self, url: str) -> PostMeme:
         ...
 
+    @abstractmethod
+    def __enter__(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __exit__(self, exception_type, exception_value, traceback):
+        raise NotImplementedError
+
 
 class UpdateMemeRepo(ABC):
     @abstractmethod
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 from ninegag_notion_scraper.app.interfaces.cookie_repo \
     import CookieRepo
@@ -9,9 +9,22 @@ class CookiesUseCase:
                  cookie_repo: CookieRepo
                  ) -> None:
         self.cookie_repo = cookie_repo
+        self._listeners: List[Callable[[List[dict]], None]] = []
 
     def get_cookies(self) -> Optional[List[dict]]:
         return self.cookie_repo.get_cookies()
 
     def save_cookies(self, data: List[dict]) -> None:
         self.cookie_repo.save_cookies(data)
+        for listener in self._listeners:
+            listener(data)
+
+    def on_save(self, listener: Callable[[List[dict]], None]) -> None:
+        """Calls listener with the cookies every time they are saved"""
+        self._listeners.append(listener)
+
+    def mark_validated(self) -> None:
+        self.cookie_repo.mark_validated()
+
+    def is_session_known_good(self) -> bool:
+        return self.cookie_repo.is_session_known_good()
@@ -41,6 +41,9 @@ class SavePostMeme:
     def save_meme(self, meme: PostMeme):
         self.meme_repo.save_meme(meme)
 
+    def save_memes(self, memes: List[PostMeme]):
+        self.meme_repo.save_memes(memes)
+
     def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
         return self.meme_repo.meme_exists(meme)
 
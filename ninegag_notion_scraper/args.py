@@ -1,4 +1,5 @@
 import argparse
+from typing import List
 from pydantic import BaseModel
 
 
@@ -7,6 +8,24 @@ class Arguments(BaseModel):
     skip_existing: bool
     save_notion_meme_locally: bool
     ignore_existing: bool
+    http_stream: bool
+    prune_streams: bool
+    measure_dom: bool
+    pipeline: bool
+    queue_size: int
+    workers: int
+    low_bandwidth: bool
+    async_downloads: bool
+    download_concurrency: int
+    download_rate: float
+    media_variant: str
+    codec_order: List[str]
+    dedup_storage: bool
+    reshard_storage: bool
+    verify_storage: bool
+    full_notion_sync: bool
+    async_notion: bool
+    notion_rps: float
 
 
 def _build_parser() -> argparse.ArgumentParser:
@@ -15,6 +34,25 @@ def _build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--skip-existing", action='store_true')
     parser.add_argument("--ignore-existing", action='store_true')
     parser.add_argument("--save-notion-meme-locally", action='store_true')
+    parser.add_argument("--http-stream", action='store_true')
+    parser.add_argument("--prune-streams", action='store_true')
+    parser.add_argument("--measure-dom", action='store_true')
+    parser.add_argument("--pipeline", action='store_true')
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--low-bandwidth", action='store_true')
+    parser.add_argument("--async-downloads", action='store_true')
+    parser.add_argument("--download-concurrency", type=int, default=64)
+    parser.add_argument("--download-rate", type=float, default=10)
+    parser.add_argument("--media-variant", default='codec',
+                        choices=['codec', 'smallest', 'best'])
+    parser.add_argument("--codec-order", default='h264,jpeg')
+    parser.add_argument("--dedup-storage", action='store_true')
+    parser.add_argument("--reshard-storage", action='store_true')
+    parser.add_argument("--verify-storage", action='store_true')
+    parser.add_argument("--full-notion-sync", action='store_true')
+    parser.add_argument("--async-notion", action='store_true')
+    parser.add_argument("--notion-rps", type=float, default=3)
     return parser
 
 
@@ -25,5 +63,23 @@ def get_args() -> Arguments:
         debug=args.debug,
         skip_existing=args.skip_existing,
         save_notion_meme_locally=args.save_notion_meme_locally,
-        ignore_existing=args.ignore_existing
+        ignore_existing=args.ignore_existing,
+        http_stream=args.http_stream,
+        prune_streams=args.prune_streams,
+        measure_dom=args.measure_dom,
+        pipeline=args.pipeline,
+        queue_size=args.queue_size,
+        workers=args.workers,
+        low_bandwidth=args.low_bandwidth,
+        async_downloads=args.async_downloads,
+        download_concurrency=args.download_concurrency,
+        download_rate=args.download_rate,
+        media_variant=args.media_variant,
+        codec_order=args.codec_order.split(','),
+        dedup_storage=args.dedup_storage,
+        reshard_storage=args.reshard_storage,
+        verify_storage=args.verify_storage,
+        full_notion_sync=args.full_notion_sync,
+        async_notion=args.async_notion,
+        notion_rps=args.notion_rps
     )
@@ -0,0 +1,207 @@
+"""Fetches single posts concurrently to save Notion memes locally"""
+
+import time
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Type
+
+from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo import GetMemeRepo
+from ninegag_notion_scraper.app.use_cases.meme import GetPostMeme, \
+    UpdateMeme
+
+
+logger = logging.getLogger('app.backfill')
+
+_DONE = object()
+
+
+@dataclass
+class WorkerStats:
+    name: str
+    fetched: int = 0
+    missing: int = 0
+    failed: int = 0
+    elapsed: float = 0
+
+    @property
+    def throughput(self) -> float:
+        return self.fetched / self.elapsed if self.elapsed else 0
+
+
+class ParallelBackfill:
+    """Runs a pool of workers, each one with its own single page scraper,
+    that fetch the memes and hand them to save. Memes that are gone from
+    9gag are tagged 'Meme404' on Notion in batches.
+
+    The first worker is set up before the others so that a login, if needed,
+    only happens once and the others reuse its saved cookies. A worker whose
+    scraper can't be set up stops, the memes are skipped only once no worker
+    is left.
+
+    Args:
+        get_scraper (Callable[[], GetMemeRepo]): builds the scraper of a
+            worker, it is used as a context manager
+        save (Callable[[PostMeme], None]): called with every fetched meme
+        notion_update (UpdateMeme): used to tag the missing memes
+        missing_exception (type): raised by the scraper for missing memes
+        workers (int): number of concurrent workers
+        batch_size (int): number of missing memes tagged at once
+    """
+
+    def __init__(self,
+                 get_scraper: Callable[[], GetMemeRepo],
+                 save: Callable[[PostMeme], None],
+                 notion_update: UpdateMeme,
+                 missing_exception: Type[Exception],
+                 workers: int = 4,
+                 batch_size: int = 20) -> None:
+        self._get_scraper = get_scraper
+        self._save = save
+        self._notion_update = notion_update
+        self._missing_exception = missing_exception
+        self._batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=workers * 2)
+        self._first_ready = threading.Event()
+        self._missing_lock = threading.Lock()
+        self._missing: List[str] = []
+        self._alive_lock = threading.Lock()
+        self._alive = workers
+        self.stats = [WorkerStats(f"worker-{x}") for x in range(workers)]
+
+    def run(self, memes: Iterable[DBMeme]) -> None:
+        threads = [
+            threading.Thread(target=self._worker, args=(stats,),
+                             name=stats.name, daemon=True)
+            for stats in self.stats
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for meme in memes:
+                if not self._put(meme):
+                    logger.error("Every worker stopped, the remaining memes "
+                                 "are skipped")
+                    break
+        finally:
+            for _ in threads:
+                if not self._put(_DONE):
+                    break
+            for thread in threads:
+                thread.join()
+            self._drain()
+            self._flush_missing()
+            if self._missing:
+                logger.warning(f"{len(self._missing)} missing memes could "
+                               "not be tagged as Meme404: "
+                               f"{', '.join(self._missing)}")
+            self._report()
+
+    def _worker(self, stats: WorkerStats) -> None:
+        if stats is not self.stats[0]:
+            self._first_ready.wait()
+
+        try:
+            with self._get_scraper() as scraper:
+                self._first_ready.set()
+                self._work(GetPostMeme(scraper), stats)
+        except Exception as error:
+            logger.error(f"{stats.name} stopped: {error!r}")
+            self._first_ready.set()
+        finally:
+            with self._alive_lock:
+                self._alive -= 1
+
+    def _put(self, item: object) -> bool:
+        """Queues item for the workers, False once no worker is left to
+        take it"""
+        while True:
+            with self._alive_lock:
+                if not self._alive:
+                    return False
+            try:
+                self._queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+
+    def _drain(self) -> None:
+        """Logs the memes left in the queue by the workers that stopped"""
+        skipped = 0
+        while True:
+            try:
+                meme = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if meme is not _DONE:
+                skipped += 1
+
+        if skipped:
+            logger.error(f"{skipped} queued memes were skipped")
+
+    def _work(self, ninegag: GetPostMeme, stats: WorkerStats) -> None:
+        start = time.perf_counter()
+
+        while (meme := self._queue.get()) is not _DONE:
+            try:
+                loaded_meme = ninegag.get_meme_from_url(meme.post_url)
+            except self._missing_exception:
+                logger.info(f"skipping Meme ID {meme.post_id} because it "
+                            "doesn't exist anymore")
+                stats.missing += 1
+                self._add_missing(meme.id)
+                continue
+            except Exception as error:
+                logger.error(f"Unable to fetch Meme ID {meme.post_id}: "
+                             f"{error!r}")
+                stats.failed += 1
+                continue
+
+            try:
+                self._save(loaded_meme)
+            except Exception as error:
+                logger.error(f"Unable to save Meme ID {meme.post_id}: "
+                             f"{error!r}")
+                stats.failed += 1
+                continue
+
+            stats.fetched += 1
+            stats.elapsed = time.perf_counter() - start
+
+        stats.elapsed = time.perf_counter() - start
+
+    def _add_missing(self, page_id: str) -> None:
+        with self._missing_lock:
+            self._missing.append(page_id)
+            if len(self._missing) < self._batch_size:
+                return
+        self._flush_missing()
+
+    def _flush_missing(self) -> None:
+        """Tags the missing memes, the ones that failed are kept for the
+        next flush"""
+        with self._missing_lock:
+            batch, self._missing = self._missing, []
+
+        failed = []
+        for page_id in batch:
+            try:
+                self._notion_update.update_meme(page_id, tags=['Meme404'])
+            except Exception as error:
+                logger.error(f"Unable to tag page {page_id} as Meme404: "
+                             f"{error!r}")
+                failed.append(page_id)
+
+        with self._missing_lock:
+            self._missing.extend(failed)
+        if (tagged := len(batch) - len(failed)):
+            logger.debug(f"Tagged {tagged} memes as Meme404")
+
+    def _report(self) -> None:
+        for stats in self.stats:
+            logger.info(f"{stats.name}: {stats.fetched} fetched, "
+                        f"{stats.missing} missing, {stats.failed} failed, "
+                        f"{stats.throughput:.2f} memes/s")
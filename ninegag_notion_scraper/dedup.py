@@ -0,0 +1,95 @@
+"""Moves an existing local archive into the blob store"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .args import Arguments
+from .env import Environments
+from .infra.repo.blob_store import BlobStore
+from .infra.repo.meme_filestorage import TEMP_SUFFIXES
+from .infra.repo.storage_layout import StorageLayout
+
+
+logger = logging.getLogger('app.storage')
+
+
+@dataclass
+class DedupStats:
+    files: int = 0
+    duplicates: int = 0
+    freed_bytes: int = 0
+
+
+def main(args: Arguments, envs: Environments) -> None:
+    if not envs.BLOBS_PATH:
+        raise ValueError("BLOBS_PATH has to be set to deduplicate the "
+                         "local storage")
+
+    workers = args.workers if args.workers > 1 else os.cpu_count() or 1
+    start = time.perf_counter()
+
+    stats = dedup_storage([envs.MEMES_PATH, envs.COVERS_PATH],
+                          BlobStore(envs.BLOBS_PATH), workers,
+                          StorageLayout(envs.STORAGE_SHARD_LEVELS))
+
+    logger.info(f"Deduplicated {stats.files} files in "
+                f"{time.perf_counter() - start:.1f}s: {stats.duplicates} "
+                f"duplicates, {stats.freed_bytes / 2 ** 20:.1f} MiB freed")
+
+
+def dedup_storage(paths: List[str], blobs: BlobStore, workers: int,
+                  layout: Optional[StorageLayout] = None) -> DedupStats:
+    """Links every file of paths to its blob. The files are hashed by
+    workers threads, hashlib releasing the GIL on large buffers. Files
+    already linked to their blob are left as they are, so an interrupted
+    run can simply be started again"""
+    os.makedirs(blobs.path, exist_ok=True)
+    for path in paths:
+        if not os.path.isdir(path):
+            logger.info(f"Skipping '{path}', it doesn't exist yet")
+    paths = [x for x in paths if os.path.isdir(x)]
+
+    for path in paths:
+        if os.stat(path).st_dev != os.stat(blobs.path).st_dev:
+            raise ValueError(f"'{path}' and the blobs have to be on the "
+                             "same filesystem to be hardlinked")
+
+    layout = layout or StorageLayout()
+    file_paths = [
+        entry.path
+        for path in paths
+        for directory in layout.directories(path)
+        for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.endswith(TEMP_SUFFIXES)
+    ]
+    stats = DedupStats()
+
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='hash') as executor:
+        digests = executor.map(BlobStore.hash_file, file_paths)
+
+        for file_path, digest in zip(file_paths, digests):
+            stats.files += 1
+            if stats.files % 1000 == 0:
+                logger.info(f"{stats.files}/{len(file_paths)} files "
+                            "deduplicated")
+
+            blob_path = blobs.blob_path(digest,
+                                        os.path.splitext(file_path)[1])
+            if os.path.exists(blob_path) and \
+                    os.path.samefile(blob_path, file_path):
+                continue
+
+            file_stat = os.stat(file_path)
+
+            if blobs.store(file_path, file_path, digest):
+                stats.duplicates += 1
+                # the bytes are gone once their last link is replaced
+                if file_stat.st_nlink == 1:
+                    stats.freed_bytes += file_stat.st_size
+
+    return stats
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -11,6 +12,15 @@ class Environments(BaseModel):
     PERSONAL_URL: str
     COVERS_PATH: str
     MEMES_PATH: str
+    BROWSER_DEBUGGER_ADDRESS: Optional[str]
+    COOKIES_PATH: str
+    STORAGE_INDEX_PATH: Optional[str]
+    BLOBS_PATH: Optional[str]
+    STORAGE_SHARD_LEVELS: int
+    DOWNLOAD_METRICS_PATH: Optional[str]
+    STORAGE_MANIFEST_PATH: Optional[str]
+    NOTION_MIRROR_PATH: Optional[str]
+    NOTION_JOURNAL_PATH: Optional[str]
 
 
 def get_envs() -> Environments:
@@ -22,5 +32,14 @@ def get_envs() -> Environments:
         NINEGAG_URL=os.environ['9GAG_URL'],
         PERSONAL_URL="172.30.0.10:5000/WebDAV/9gag-memes",
         COVERS_PATH=os.getenv("COVERS_PATH", "./dump/covers"),
-        MEMES_PATH=os.getenv("MEMES_PATH", "./dump/memes")
+        MEMES_PATH=os.getenv("MEMES_PATH", "./dump/memes"),
+        BROWSER_DEBUGGER_ADDRESS=os.getenv("BROWSER_DEBUGGER_ADDRESS"),
+        COOKIES_PATH=os.getenv("COOKIES_PATH", "cookies.pkl"),
+        STORAGE_INDEX_PATH=os.getenv("STORAGE_INDEX_PATH"),
+        BLOBS_PATH=os.getenv("BLOBS_PATH"),
+        STORAGE_SHARD_LEVELS=int(os.getenv("STORAGE_SHARD_LEVELS", "0")),
+        DOWNLOAD_METRICS_PATH=os.getenv("DOWNLOAD_METRICS_PATH"),
+        STORAGE_MANIFEST_PATH=os.getenv("STORAGE_MANIFEST_PATH"),
+        NOTION_MIRROR_PATH=os.getenv("NOTION_MIRROR_PATH"),
+        NOTION_JOURNAL_PATH=os.getenv("NOTION_JOURNAL_PATH")
     )
@@ -0,0 +1,137 @@
+"""HTTP clients shared by everything fetching without the browser"""
+
+import logging
+import importlib.util
+from http.cookiejar import CookieJar
+from threading import Lock
+from typing import Callable, List, Optional
+import httpx
+
+from .user_agent import get_user_agent
+
+
+logger = logging.getLogger('app.http')
+
+CookiesFunc = Callable[[], Optional[List[dict]]]
+
+
+class HTTPClients:
+    """One sync and one async httpx client, speaking HTTP/2 when the h2
+    package is installed. Their connections are kept alive and reused, so
+    the requests to a 9gag CDN host are multiplexed over a few connections
+    instead of paying for a TLS handshake per file
+
+    Both clients share a cookie jar, loaded with the selenium cookies
+    returned by get_cookies on first use and replaced by set_cookies, which
+    CookiesUseCase calls whenever the browser saves new ones. Cookies keep
+    their domain, so they are only sent to the hosts they belong to
+
+    The async client is bound to the event loop it is first used from,
+    whoever runs that loop closes it with aclose()
+
+    Args:
+        get_cookies (Callable): returns the selenium cookies
+        max_connections (int): size of the connection pool of each client
+        timeout (float): seconds before a request is given up
+        user_agent (str): sent with every request
+        http2 (bool): negotiate HTTP/2 with the hosts supporting it
+    """
+
+    def __init__(self,
+                 get_cookies: Optional[CookiesFunc] = None,
+                 max_connections: int = 64,
+                 timeout: float = 30,
+                 user_agent: Optional[str] = None,
+                 http2: bool = True) -> None:
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.user_agent = user_agent or get_user_agent()
+        self.http2 = http2 and self._h2_available()
+
+        self._get_cookies = get_cookies
+        self._cookies_loaded = get_cookies is None
+        self._jar = CookieJar()
+        self._lock = Lock()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            self._load_cookies()
+            if self._client is None:
+                self._client = httpx.Client(**self._client_kwargs())
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            self._load_cookies()
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(
+                    **self._client_kwargs())
+            return self._async_client
+
+    def set_cookies(self, cookies: Optional[List[dict]]) -> None:
+        """Replaces the cookies of both clients"""
+        with self._lock:
+            self._cookies_loaded = True
+            self._set_cookies(cookies or [])
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client:
+            client.close()
+
+    async def aclose(self) -> None:
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client:
+            await client.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def _client_kwargs(self) -> dict:
+        return dict(
+            http2=self.http2,
+            cookies=self._jar,
+            headers={'User-Agent': self.user_agent},
+            follow_redirects=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections),
+        )
+
+    def _load_cookies(self) -> None:
+        if self._cookies_loaded or self._get_cookies is None:
+            return
+        self._cookies_loaded = True
+
+        if not (cookies := self._get_cookies()):
+            logger.info("No cookies found, requesting anonymously")
+            return
+        self._set_cookies(cookies)
+
+    def _set_cookies(self, cookies: List[dict]) -> None:
+        # the jar is shared with the clients, it is updated in place
+        self._jar.clear()
+        jar = httpx.Cookies(self._jar)
+        for cookie in cookies:
+            jar.set(cookie['name'], cookie['value'],
+                    domain=cookie.get('domain', ''),
+                    path=cookie.get('path', '/'))
+        logger.debug(f"{len(cookies)} cookies loaded")
+
+    @staticmethod
+    def _h2_available() -> bool:
+        if importlib.util.find_spec('h2') is None:
+            logger.warning("The h2 package is missing, falling back to "
+                           "HTTP/1.1")
+            return False
+        return True
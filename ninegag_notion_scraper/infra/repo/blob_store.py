@@ -0,0 +1,83 @@
+import os
+import hashlib
+import logging
+from typing import Optional
+
+
+logger = logging.getLogger('app.storage')
+
+# the link about to replace a file, left behind if interrupted
+LINK_SUFFIX = '.link'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def fsync_directory(path: str) -> None:
+    """Makes the renames and links in path durable"""
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class BlobStore:
+    """Keeps a single copy of each file under the sha256 digest of its
+    bytes, as '<digest[:2]>/<digest><ext>'. The '{post_id}.{ext}' files are
+    hardlinks to their blob, so they still are regular files to everything
+    else, and a blob is freed once nothing links to it anymore
+
+    The blobs have to be on the same filesystem as the memes and covers"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def blob_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.path, digest[:2], digest + extension)
+
+    def store(self, source_path: str, destination_path: str,
+              digest: str) -> bool:
+        """Adds source_path to the store unless its bytes already are, then
+        makes destination_path a link to the blob. source_path is removed
+        when it isn't destination_path. Returns whether the bytes were
+        already stored"""
+        extension = os.path.splitext(destination_path)[1]
+        blob_path = self.blob_path(digest, extension)
+        blob_directory = os.path.dirname(blob_path)
+        os.makedirs(blob_directory, exist_ok=True)
+
+        try:
+            os.link(source_path, blob_path)
+            duplicate = False
+            fsync_directory(blob_directory)
+        except FileExistsError:
+            duplicate = True
+            logger.debug(f"'{os.path.basename(destination_path)}' is a "
+                         f"duplicate of blob {digest}")
+
+        if not os.path.exists(destination_path) or \
+                not os.path.samefile(blob_path, destination_path):
+            temp_path = destination_path + LINK_SUFFIX
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            os.link(blob_path, temp_path)
+            os.replace(temp_path, destination_path)
+
+        if source_path != destination_path:
+            os.remove(source_path)
+
+        return duplicate
+
+    @staticmethod
+    def new_hash(partial_path: Optional[str] = None):
+        """A sha256 hash, fed with the bytes of partial_path when a download
+        resumes"""
+        digest = hashlib.sha256()
+        if partial_path:
+            with open(partial_path, 'rb') as file:
+                while (chunk := file.read(HASH_CHUNK_SIZE)):
+                    digest.update(chunk)
+        return digest
+
+    @classmethod
+    def hash_file(cls, path: str) -> str:
+        return cls.new_hash(path).hexdigest()
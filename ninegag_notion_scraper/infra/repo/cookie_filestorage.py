@@ -1,20 +1,121 @@
 import os
+import time
+import fcntl
 import pickle
-from typing import List, Optional
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
 from ninegag_notion_scraper.app.interfaces.cookie_repo \
     import CookieRepo
 
 PICKLE_COOKIES = "cookies.pkl"
 
 
+logger = logging.getLogger('app.cookies')
+
+
 class FileCookiesRepo(CookieRepo):
+    """Stores the selenium cookies with the time they were last seen logged
+    in. Reads and writes go through a file lock and writes are atomic, so
+    several scraper processes on the same host can share the file
+
+    Args:
+        path (str): where the cookies are pickled
+        trust_for (float): seconds a validated session is trusted for
+        domain (str): only the expiry of cookies from this domain matters
+    """
+
+    def __init__(self, path: str = PICKLE_COOKIES,
+                 trust_for: float = 6 * 60 * 60,
+                 domain: str = '9gag.com') -> None:
+        self.path = path
+        self.trust_for = trust_for
+        self.domain = domain
+
     def get_cookies(self) -> Optional[List[dict]]:
-        if not os.path.exists(PICKLE_COOKIES):
+        with self._lock(exclusive=False):
+            if (state := self._read()) is None:
+                return None
+        return state['cookies']
+
+    def save_cookies(self, data: List[dict]) -> None:
+        with self._lock(exclusive=True):
+            self._write({
+                'cookies': data,
+                'saved_at': time.time(),
+                'validated_at': None,
+            })
+
+    def mark_validated(self) -> None:
+        with self._lock(exclusive=True):
+            if (state := self._read()) is None:
+                return
+            state['validated_at'] = time.time()
+            self._write(state)
+
+    def is_session_known_good(self) -> bool:
+        with self._lock(exclusive=False):
+            state = self._read()
+
+        if state is None or not state['validated_at']:
+            return False
+
+        now = time.time()
+
+        if now - state['validated_at'] > self.trust_for:
+            logger.debug("Session was validated too long ago")
+            return False
+
+        if (expires_at := self._expires_at(state['cookies'])) and \
+                expires_at <= now:
+            logger.debug("Session cookies are expired")
+            return False
+
+        return True
+
+    def _expires_at(self, cookies: List[dict]) -> Optional[float]:
+        """The earliest expiry of the persistent cookies of the domain"""
+        expiries = [
+            cookie['expiry'] for cookie in cookies
+            if 'expiry' in cookie
+            and cookie.get('domain', '').lstrip('.').endswith(self.domain)
+        ]
+        return min(expiries) if expiries else None
+
+    @contextmanager
+    def _lock(self, exclusive: bool) -> Iterator[None]:
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file,
+                        fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> Optional[dict]:
+        if not os.path.exists(self.path):
             return None
 
-        with open(PICKLE_COOKIES, "rb") as pcookie:
-            cookies = pickle.load(pcookie)
-        return cookies
+        with open(self.path, "rb") as pcookie:
+            state = pickle.load(pcookie)
 
-    def save_cookies(self, data: List[dict]) -> None:
-        pickle.dump(data, open(PICKLE_COOKIES, "wb"))
+        # cookies saved before the session state was recorded
+        if isinstance(state, list):
+            return {'cookies': state, 'saved_at': None,
+                    'validated_at': None}
+        return state
+
+    def _write(self, state: dict) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory,
+                                                      suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, "wb") as pcookie:
+                pickle.dump(state, pcookie)
+                pcookie.flush()
+                os.fsync(pcookie.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -0,0 +1,313 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import itertools
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, \
+    TypeVar
+from urllib.parse import urlparse
+
+
+logger = logging.getLogger('app.storage')
+
+T = TypeVar('T')
+
+# statuses worth trying again, the others won't change by retrying
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, and bursts of up to
+    capacity requests. Tokens go negative when reserved ahead, which is how
+    waiting callers queue up"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Takes a token, returns the seconds to wait before using it"""
+        self._refill(now)
+        self.tokens -= 1
+        return max(0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float, now: float) -> None:
+        """No token is available for the next seconds"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold failures in a row, for reset_timeout
+    seconds. Once that time is up a single request probes the host: its
+    success closes the circuit, its failure opens it again"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    def wait(self, now: float) -> float:
+        """Seconds to wait before trying again, 0 if a request may go"""
+        if self.opened_at is None:
+            return 0
+        if (remaining := self.opened_at + self.reset_timeout - now) > 0:
+            return remaining
+        if self.probing:
+            return min(1, self.reset_timeout)
+        self.probing = True
+        return 0
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_abort(self) -> None:
+        """A request ended without telling anything about the host, so
+        another request may probe it"""
+        self.probing = False
+
+    def record_failure(self, now: float) -> bool:
+        """Returns whether the circuit just opened"""
+        self.failures += 1
+        if self.probing or (self.opened_at is None
+                            and self.failures >= self.failure_threshold):
+            self.opened_at = now
+            self.probing = False
+            return True
+        return False
+
+
+class _Host:
+    def __init__(self, bucket: TokenBucket, breaker: CircuitBreaker) -> None:
+        self.bucket = bucket
+        self.breaker = breaker
+        self.counters: Dict[str, float] = defaultdict(float)
+
+
+class DownloadPolicy:
+    """Rate limits, retries and circuit breaks the downloads, per host
+
+    Each host gets a token bucket and a circuit breaker. Failed requests
+    (connection errors, incomplete bodies, 408, 429 and 5xx) are retried
+    with full jitter exponential backoff, or after their Retry-After, which
+    also pauses the bucket of the host. The counters of each host are
+    logged by close() and, with metrics_path, appended to it as json lines
+    every metrics_interval seconds
+
+    Args:
+        rate (float): requests per second allowed to each host
+        burst (float): requests a host can get at once
+        retries (int): retries of a request before giving up
+        backoff (float): seconds of the first retry backoff
+        max_backoff (float): longest wait between two retries
+        failure_threshold (int): failures in a row opening the circuit
+        reset_timeout (float): seconds before an open circuit is probed
+        metrics_path (str): where the counters are appended
+        metrics_interval (float): seconds between two appends
+    """
+
+    def __init__(self,
+                 rate: float = 10,
+                 burst: float = 20,
+                 retries: int = 5,
+                 backoff: float = 1,
+                 max_backoff: float = 60,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30,
+                 metrics_path: Optional[str] = None,
+                 metrics_interval: float = 60) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+
+        self._lock = Lock()
+        self._hosts: Dict[str, _Host] = {}
+        self._emitted_at = time.monotonic()
+
+    def call(self, url: str, func: Callable[[], T],
+             errors: Tuple[Type[BaseException], ...]) -> T:
+        """Calls func, which requests url, within the policy. errors are
+        the exceptions of a failed request, a status_code attribute tells
+        whether it is worth retrying"""
+        for attempt in itertools.count():
+            granted = False
+            while not granted:
+                delay, granted = self._next_delay(url)
+                time.sleep(delay)
+            try:
+                result = func()
+            except errors as error:
+                if (retry_in := self._on_error(url, attempt, error)) is None:
+                    raise
+                time.sleep(retry_in)
+                continue
+            except BaseException:
+                self._on_abort(url)
+                raise
+            self._on_success(url)
+            return result
+        raise AssertionError("unreachable")
+
+    async def async_call(self, url: str, func: Callable[[], Awaitable[T]],
+                         errors: Tuple[Type[BaseException], ...]) -> T:
+        """Same as call, for coroutines"""
+        for attempt in itertools.count():
+            granted = False
+            while not granted:
+                delay, granted = self._next_delay(url)
+                await asyncio.sleep(delay)
+            try:
+                result = await func()
+            except errors as error:
+                if (retry_in := self._on_error(url, attempt, error)) is None:
+                    raise
+                await asyncio.sleep(retry_in)
+                continue
+            except BaseException:
+                self._on_abort(url)
+                raise
+            self._on_success(url)
+            return result
+        raise AssertionError("unreachable")
+
+    @property
+    def counters(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(host.counters)
+                    for name, host in self._hosts.items()}
+
+    def close(self) -> None:
+        for name, counters in self.counters.items():
+            logger.info(f"Downloads from {name}: " + ", ".join(
+                f"{key} {value:g}" for key, value in sorted(counters.items())
+            ))
+        self._emit()
+
+    def _host(self, url: str) -> _Host:
+        name = urlparse(url).netloc
+        if name not in self._hosts:
+            self._hosts[name] = _Host(
+                TokenBucket(self.rate, self.burst),
+                CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return self._hosts[name]
+
+    def _next_delay(self, url: str) -> Tuple[float, bool]:
+        """The seconds to wait before requesting url, and whether the
+        request may go after waiting them, else this has to be asked
+        again. A request that may go has already taken its token"""
+        now = time.monotonic()
+        with self._lock:
+            host = self._host(url)
+            if (delay := host.breaker.wait(now)) > 0:
+                host.counters['circuit_waits'] += 1
+                return delay, False
+            delay = host.bucket.reserve(now)
+            host.counters['requests'] += 1
+            if delay:
+                host.counters['rate_limited_seconds'] += delay
+        return delay, True
+
+    def _on_success(self, url: str) -> None:
+        with self._lock:
+            host = self._host(url)
+            host.breaker.record_success()
+            host.counters['successes'] += 1
+        self._maybe_emit()
+
+    def _on_abort(self, url: str) -> None:
+        """Records a request ended by an exception outside of errors, which
+        says nothing about the host but must not hold its probe"""
+        with self._lock:
+            host = self._host(url)
+            host.breaker.record_abort()
+            host.counters['aborted'] += 1
+
+    def _on_error(self, url: str, attempt: int,
+                  error: BaseException) -> Optional[float]:
+        """Records the failure, returns the seconds to wait before the next
+        try or None if the request shouldn't be retried"""
+        status_code: Optional[int] = getattr(error, 'status_code', None)
+        retry_after = self._parse_retry_after(
+            getattr(error, 'retry_after', None))
+        retryable = status_code is None or status_code in RETRY_STATUSES
+        now = time.monotonic()
+
+        with self._lock:
+            host = self._host(url)
+            if not retryable:
+                # the host answered fine, the resource is the problem
+                host.breaker.record_success()
+                host.counters['errors'] += 1
+                return None
+
+            host.counters['failures'] += 1
+            if status_code in THROTTLE_STATUSES:
+                host.counters['throttled'] += 1
+                if retry_after is not None:
+                    host.bucket.pause(retry_after, now)
+            if host.breaker.record_failure(now):
+                host.counters['circuit_opened'] += 1
+                logger.warning(f"Pausing downloads from "
+                               f"{urlparse(url).netloc} for "
+                               f"{self.reset_timeout:g}s after "
+                               f"{host.breaker.failures} failures")
+
+            if attempt >= self.retries:
+                host.counters['given_up'] += 1
+                return None
+            host.counters['retries'] += 1
+
+        self._maybe_emit()
+
+        delay = retry_after if retry_after is not None else \
+            random.uniform(0, min(self.max_backoff,
+                                  self.backoff * 2 ** attempt))
+        logger.info(f"Retrying {url} in {delay:.1f}s: {error!r}")
+        return delay
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Retry-After is either seconds or an HTTP date"""
+        if not value:
+            return None
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp()
+                       - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _maybe_emit(self) -> None:
+        if time.monotonic() - self._emitted_at >= self.metrics_interval:
+            self._emit()
+
+    def _emit(self) -> None:
+        self._emitted_at = time.monotonic()
+        if not self.metrics_path:
+            return
+        with open(self.metrics_path, 'a') as file:
+            file.write(json.dumps({'time': time.time(),
+                                   'hosts': self.counters}) + '\n')
@@ -1,21 +1,41 @@
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Callable
+from threading import Lock
+from typing import Callable, Dict, List, Mapping, Optional, Set, Tuple
 from urllib.parse import urlparse
 import validators
-import requests
-import glob
+import httpx
+import json
 import logging
 
 from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
 from ninegag_notion_scraper.app.interfaces.meme_repo import SaveMemeRepo
+from ninegag_notion_scraper.infra.http_client import HTTPClients
+
+from .blob_store import LINK_SUFFIX, BlobStore, fsync_directory
+from .download_policy import DownloadPolicy
+from .storage_layout import StorageLayout
+from .storage_manifest import StorageManifest
 
 
 logger = logging.getLogger('app.storage')
 
+PARTIAL_SUFFIX = '.part'
+# next to a '.part', what identifies the version of the remote file in it
+VALIDATOR_SUFFIX = '.part.validator'
+# the files of a download in progress, or of a link being replaced
+TEMP_SUFFIXES = (PARTIAL_SUFFIX, VALIDATOR_SUFFIX, LINK_SUFFIX)
+CHUNK_SIZE = 64 * 1024
+
 
 class DownloadError(Exception):
-    pass
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retry_after: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
 
 
 @dataclass
@@ -24,65 +44,364 @@ class URLItem:
     file_extension: str
 
 
+class PostIDIndex:
+    """Post ids of the files present in each storage directory, built with
+    a single os.scandir pass per directory of the layout the first time it
+    is needed
+
+    When cache_path is set, the ids are persisted along with the mtime of
+    each directory by save(), and reused on the next run as long as the
+    directory wasn't modified in between. A directory modified since its
+    ids were loaded, by this run's downloads or by another process, is
+    scanned again before being persisted"""
+
+    def __init__(self, cache_path: Optional[str] = None,
+                 layout: Optional[StorageLayout] = None) -> None:
+        self.cache_path = cache_path
+        self.layout = layout or StorageLayout()
+        self._lock = Lock()
+        self._ids: Dict[str, Set[str]] = {}
+        # mtime of each directory when its ids were loaded
+        self._mtimes: Dict[str, int] = {}
+        self._cache = self._read_cache()
+
+    def contains(self, path: str, post_id: str) -> bool:
+        return post_id in self._get(path)
+
+    def add(self, path: str, post_id: str) -> None:
+        self._get(path).add(post_id)
+
+    def save(self) -> None:
+        if not self.cache_path:
+            return
+
+        with self._lock:
+            loaded = {path: (set(ids), self._mtimes[path])
+                      for path, ids in self._ids.items()
+                      if path in self._mtimes}
+
+        cache = {}
+        for path, (ids, mtime_ns) in loaded.items():
+            if not os.path.isdir(path):
+                continue
+            if (current_mtime_ns := self.layout.mtime_ns(path)) != mtime_ns:
+                # the ids added by this run don't account for what other
+                # processes added or removed meanwhile
+                mtime_ns = current_mtime_ns
+                ids = self.build(path, self.layout)
+            cache[path] = {'mtime_ns': mtime_ns,
+                           'levels': self.layout.levels,
+                           'ids': sorted(ids)}
+
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(cache, file)
+        os.replace(temp_path, self.cache_path)
+
+    def _get(self, path: str) -> Set[str]:
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._ids:
+                self._ids[path] = self._load(path)
+            return self._ids[path]
+
+    def _load(self, path: str) -> Set[str]:
+        if not os.path.isdir(path):
+            return set()
+        # read before the scan, so a change during it shows on save()
+        self._mtimes[path] = mtime_ns = self.layout.mtime_ns(path)
+        cached = self._cache.get(path)
+        if cached and cached.get('levels', 0) == self.layout.levels and \
+                cached['mtime_ns'] == mtime_ns:
+            logger.debug(f"Using the cached index of '{path}'")
+            return set(cached['ids'])
+        return self.build(path, self.layout)
+
+    @staticmethod
+    def build(path: str,
+              layout: Optional[StorageLayout] = None) -> Set[str]:
+        start = time.perf_counter()
+        ids: Set[str] = set()
+
+        for directory in (layout or StorageLayout()).directories(path):
+            with os.scandir(directory) as entries:
+                ids.update(
+                    os.path.splitext(entry.name)[0] for entry in entries
+                    if not entry.name.endswith(TEMP_SUFFIXES)
+                    and entry.is_file()
+                )
+
+        logger.debug(f"Indexed {len(ids)} files in '{path}' in "
+                     f"{time.perf_counter() - start:.3f}s")
+        return ids
+
+    def _read_cache(self) -> dict:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path) as file:
+                cache = json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable index cache: {error!r}")
+            return {}
+
+        if not isinstance(cache, dict) or not all(
+                isinstance(x, dict) and
+                isinstance(x.get('mtime_ns'), int) and
+                isinstance(x.get('ids'), list)
+                for x in cache.values()):
+            logger.warning("Ignoring index cache of an unknown format")
+            return {}
+
+        return cache
+
+
 class FileStorageRepo(SaveMemeRepo):
-    """A class to save items locally on the file system"""
+    """A class to save items locally on the file system
+
+    Downloads run on a pool of max_workers threads sharing the client of
+    clients, their own HTTPClients if not given. When blobs_path is set,
+    the files are deduplicated in a BlobStore there. The files are placed
+    in memes_path and covers_path following layout, flat by default. Every
+    request goes through policy, a default DownloadPolicy if not given.
+    Saved files are recorded in manifest when there is one"""
 
     def __init__(self, covers_path: str,
-                 memes_path: str, _selenium_cookies_func: Callable) -> None:
+                 memes_path: str, _selenium_cookies_func: Callable,
+                 max_workers: int = 8,
+                 index_cache_path: Optional[str] = None,
+                 blobs_path: Optional[str] = None,
+                 layout: Optional[StorageLayout] = None,
+                 policy: Optional[DownloadPolicy] = None,
+                 manifest: Optional[StorageManifest] = None,
+                 clients: Optional[HTTPClients] = None) -> None:
         self.meme_path = memes_path
         self.covers_path = covers_path
+        self.layout = layout or StorageLayout()
+        self.policy = policy or DownloadPolicy()
+        self._index = PostIDIndex(index_cache_path, self.layout)
+        self._blobs = BlobStore(blobs_path) if blobs_path else None
+        self._manifest = manifest
 
-        # Request setup
-        self._session = requests.Session()
-        self._selenium_cookies_func = _selenium_cookies_func
-        self._cookie_loaded_flag = False
+        self._owns_clients = clients is None
+        self.clients = clients or HTTPClients(_selenium_cookies_func,
+                                              max_connections=max_workers)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='download')
 
     def save_meme(self, meme: PostMeme, update=False) -> None:
         if update:
             logger.warning("Kwarg 'update' is not implmented in this class")
-        self._save_cover_from_url(meme.post_cover_photo_url, meme.post_id)
-        assert meme.post_file_url
-        self._save_meme_from_url(meme.post_file_url, meme.post_id)
+        self._wait(self._submit_meme(meme))
+
+    def save_memes(self, memes: List[PostMeme]) -> None:
+        """Downloads the files of all the memes concurrently"""
+        self._wait([
+            future for meme in memes for future in self._submit_meme(meme)
+        ])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._owns_clients:
+            self.clients.close()
+        self._index.save()
+        self.policy.close()
+        if self._manifest:
+            self._manifest.close()
 
     def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
         logger.debug(f"Checking if meme {meme.post_id} exists")
-        meme_exists = glob.glob(
-            os.path.join(self.meme_path, f"{meme.post_id}.*")
-        )
-        cover_exists = glob.glob(
-            os.path.join(self.covers_path, f"{meme.post_id}.*")
-        )
+        meme_exists = self._index.contains(self.meme_path, meme.post_id)
+        cover_exists = self._index.contains(self.covers_path, meme.post_id)
         return all([meme_exists, cover_exists])
 
-    @property
-    def session(self) -> requests.Session:
-        if not self._cookie_loaded_flag:
-            self._load_cookies()
-            self._cookie_loaded_flag = True
-        return self._session
+    def _submit_meme(self, meme: PostMeme) -> List[Future]:
+        assert meme.post_file_url
+        return [
+            self._executor.submit(self._save_cover_from_url,
+                                  meme.post_cover_photo_url, meme.post_id),
+            self._executor.submit(self._save_meme_from_url,
+                                  meme.post_file_url, meme.post_id),
+        ]
 
-    def _load_cookies(self) -> None:
-        for cookie in self._selenium_cookies_func():
-            self._session.cookies.set(cookie['name'], cookie['value'])
-        logger.debug("Cookies loaded")
+    @staticmethod
+    def _wait(futures: List[Future]) -> None:
+        """Waits for every download and raises the first error"""
+        errors = [x.exception() for x in futures]
+        for error in errors:
+            if error:
+                raise error
 
     def _save_file_from_url_and_path(self, url: str, file_id: str, path: str):
+        """Downloads the file within the download policy, a failed try
+        resumes where the previous one stopped"""
         self._validate_url(url)
+        self.policy.call(
+            url, lambda: self._download_file(url, file_id, path),
+            errors=(DownloadError, httpx.TransportError))
+
+    def _download_file(self, url: str, file_id: str, path: str) -> None:
+        """Streams the file to a '.part' file next to its destination and
+        renames it once complete. A '.part' left by an interrupted download
+        is resumed with a Range request, as long as the remote file is
+        still the one it holds"""
         url_item = self._get_url_items_from_url(url)
-        response = self.session.get(url)
-        destination_path = os.path.join(path,
+        start = time.perf_counter()
+        directory = self.layout.directory(path, file_id)
+        os.makedirs(directory, exist_ok=True)
+        destination_path = os.path.join(directory,
                                         file_id + url_item.file_extension)
+        partial_path = destination_path + PARTIAL_SUFFIX
 
-        if response.status_code == 200:
-            with open(destination_path, 'wb') as file:
-                file.write(response.content)
-        else:
+        offset, headers = self._get_resume(partial_path)
+
+        with self.clients.client.stream('GET', url,
+                                        headers=headers) as response:
+            if offset and (response.status_code == 416 or
+                           response.status_code == 206 and
+                           self._get_range_start(response.headers) != offset):
+                # the partial file doesn't match the remote one anymore
+                self._remove_partial(partial_path)
+                return self._download_file(url, file_id, path)
+
+            if response.status_code == 206:
+                mode = 'ab'
+                expected_size = self._get_total_size(response.headers)
+            elif response.status_code == 200:
+                mode = 'wb'
+                offset = 0
+                expected_size = self._get_content_length(response.headers)
+                self._save_validator(partial_path, response.headers)
+            else:
+                raise DownloadError(
+                    "Failed to download file. Status code: "
+                    f"{response.status_code}",
+                    status_code=response.status_code,
+                    retry_after=response.headers.get('Retry-After'))
+
+            content_type = response.headers.get('Content-Type')
+            digest = BlobStore.new_hash(partial_path if offset else None) \
+                if self._blobs or self._manifest else None
+
+            with open(partial_path, mode) as file:
+                for chunk in response.iter_bytes(CHUNK_SIZE):
+                    file.write(chunk)
+                    if digest:
+                        digest.update(chunk)
+                file.flush()
+                os.fsync(file.fileno())
+
+        size = os.path.getsize(partial_path)
+        if expected_size is not None and size != expected_size:
             raise DownloadError(
-                "Failed to download file. Status code: "
-                f"{response.status_code}")
+                f"Incomplete download of {url}: got {size} of "
+                f"{expected_size} bytes, it will resume on the next try")
+
+        sha256 = digest.hexdigest() if digest else None
+        self._commit(self._blobs, partial_path, destination_path, sha256)
+        self._index.add(path, file_id)
+        if self._manifest:
+            self._manifest.record(path, file_id, destination_path, url,
+                                  sha256, content_type)
 
         logger.debug(f"File: '{file_id + url_item.file_extension}'"
-                     f" saved in: '{path}'")
+                     f" saved in: '{directory}' ({size - offset} bytes"
+                     f"{f' resumed at {offset}' if offset else ''}"
+                     f" in {time.perf_counter() - start:.3f}s)")
+
+    @staticmethod
+    def _get_content_length(headers: Mapping[str, str]) -> Optional[int]:
+        # the length of an encoded body doesn't match the decoded bytes
+        if headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        if (length := headers.get('Content-Length')) is None:
+            return None
+        return int(length)
+
+    @staticmethod
+    def _get_resume(partial_path: str) -> Tuple[int, Dict[str, str]]:
+        """Where to resume partial_path from and the headers asking for it.
+        It starts over when the version of the remote file it holds isn't
+        known, If-Range has the whole file sent if it changed since"""
+        if not os.path.exists(partial_path):
+            return 0, {}
+
+        offset = os.path.getsize(partial_path)
+        try:
+            with open(FileStorageRepo._validator_path(partial_path)) as file:
+                validator = file.read()
+        except OSError:
+            validator = ''
+
+        if not offset or not validator:
+            return 0, {}
+        return offset, {'Range': f'bytes={offset}-', 'If-Range': validator}
+
+    @staticmethod
+    def _save_validator(partial_path: str,
+                        headers: Mapping[str, str]) -> None:
+        """Keeps the ETag or Last-Modified of the file being downloaded to
+        partial_path, for a later resume"""
+        etag = headers.get('ETag')
+        # a weak ETag can't be used in If-Range
+        validator = etag if etag and not etag.startswith('W/') else \
+            headers.get('Last-Modified')
+        validator_path = FileStorageRepo._validator_path(partial_path)
+
+        if validator:
+            with open(validator_path, 'w') as file:
+                file.write(validator)
+        elif os.path.exists(validator_path):
+            os.remove(validator_path)
+
+    @staticmethod
+    def _validator_path(partial_path: str) -> str:
+        return partial_path[:-len(PARTIAL_SUFFIX)] + VALIDATOR_SUFFIX
+
+    @staticmethod
+    def _remove_partial(partial_path: str) -> None:
+        for temp_path in (partial_path,
+                          FileStorageRepo._validator_path(partial_path)):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _get_range_start(headers: Mapping[str, str]) -> Optional[int]:
+        # Content-Range: bytes <start>-<end>/<total or *>
+        unit, _, content_range = headers.get('Content-Range', '').partition(
+            ' ')
+        start = content_range.partition('-')[0]
+        return int(start) if unit == 'bytes' and start.isdigit() else None
+
+    @staticmethod
+    def _get_total_size(headers: Mapping[str, str]) -> Optional[int]:
+        # Content-Range: bytes <start>-<end>/<total or *>
+        content_range = headers.get('Content-Range', '')
+        total = content_range.rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    @staticmethod
+    def _commit(blobs: Optional[BlobStore], partial_path: str,
+                destination_path: str, digest: Optional[str]) -> None:
+        """Moves the complete download to its destination, through the blob
+        store when there is one"""
+        validator_path = FileStorageRepo._validator_path(partial_path)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+
+        if blobs and digest:
+            blobs.store(partial_path, destination_path, digest)
+        else:
+            os.replace(partial_path, destination_path)
+        fsync_directory(os.path.dirname(destination_path))
 
     def _save_meme_from_url(self, url: str, file_id: str):
         return self._save_file_from_url_and_path(url,
@@ -94,11 +413,13 @@ class FileStorageRepo(SaveMemeRepo):
                                                  file_id,
                                                  self.covers_path)
 
-    def _validate_url(self, url: str) -> None:
+    @staticmethod
+    def _validate_url(url: str) -> None:
         if not validators.url(url):
             raise ValueError("Value passed is not a url")
 
-    def _get_url_items_from_url(self, url: str) -> URLItem:
+    @staticmethod
+    def _get_url_items_from_url(url: str) -> URLItem:
         url_parse = urlparse(url)
         file_path, file_ext = os.path.splitext(url_parse.path)
         return URLItem(file_path.split('/')[-1], file_ext)
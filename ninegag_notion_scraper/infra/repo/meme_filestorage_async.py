@@ -0,0 +1,291 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Future, wait
+from threading import BoundedSemaphore, Lock, Thread
+from typing import IO, Callable, Dict, List, NamedTuple, Optional
+import httpx
+
+from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo import SaveMemeRepo
+from ninegag_notion_scraper.infra.http_client import HTTPClients
+
+from .blob_store import BlobStore
+from .download_policy import DownloadPolicy
+from .storage_layout import StorageLayout
+from .storage_manifest import StorageManifest
+from .meme_filestorage import CHUNK_SIZE, PARTIAL_SUFFIX, DownloadError, \
+    FileStorageRepo, PostIDIndex
+
+
+logger = logging.getLogger('app.storage')
+
+
+class _Download(NamedTuple):
+    expected_size: Optional[int]
+    offset: int
+    sha256: Optional[str]
+    content_type: Optional[str]
+
+
+class AsyncFileStorageRepo(SaveMemeRepo):
+    """Saves items locally like FileStorageRepo, but the downloads run as
+    coroutines on an event loop of its own, in a background thread, sharing
+    the async client of clients. That client is bound to the loop, so it is
+    closed with the repo even when clients is shared
+
+    save_meme only schedules the downloads and returns, waiting when
+    max_pending memes are already in flight. Errors are logged as they
+    happen and the first one is raised by flush() or close()
+
+    Args:
+        covers_path (str): where the covers are saved
+        memes_path (str): where the memes are saved
+        _selenium_cookies_func (Callable): returns the selenium cookies
+        max_concurrency (int): downloads running at once, also the size of
+            the connection pool of its own clients
+        max_pending (int): memes scheduled before save_meme blocks
+        index_cache_path (str): see PostIDIndex
+        blobs_path (str): deduplicates the files in a BlobStore there
+        layout (StorageLayout): how the files are placed, flat by default
+        policy (DownloadPolicy): rate limits and retries the requests
+        manifest (StorageManifest): where the saved files are recorded
+        clients (HTTPClients): the shared clients, the repo's own if not
+            given
+    """
+
+    def __init__(self, covers_path: str,
+                 memes_path: str, _selenium_cookies_func: Callable,
+                 max_concurrency: int = 64,
+                 max_pending: int = 256,
+                 index_cache_path: Optional[str] = None,
+                 blobs_path: Optional[str] = None,
+                 layout: Optional[StorageLayout] = None,
+                 policy: Optional[DownloadPolicy] = None,
+                 manifest: Optional[StorageManifest] = None,
+                 clients: Optional[HTTPClients] = None) -> None:
+        self.meme_path = memes_path
+        self.covers_path = covers_path
+        self.max_concurrency = max_concurrency
+        self.layout = layout or StorageLayout()
+        self.policy = policy or DownloadPolicy()
+        self._manifest = manifest
+        self._index = PostIDIndex(index_cache_path, self.layout)
+        self._blobs = BlobStore(blobs_path) if blobs_path else None
+        self._owns_clients = clients is None
+        self.clients = clients or HTTPClients(_selenium_cookies_func,
+                                              max_connections=max_concurrency)
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._slots = BoundedSemaphore(max_pending)
+        self._lock = Lock()
+        self._pending: Dict[str, Future] = {}
+        self._errors: List[BaseException] = []
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever,
+                              name='download-loop', daemon=True)
+        self._thread.start()
+
+    def save_meme(self, meme: PostMeme, update=False) -> None:
+        if update:
+            logger.warning("Kwarg 'update' is not implmented in this class")
+        self._submit_meme(meme)
+
+    def save_memes(self, memes: List[PostMeme]) -> None:
+        """Downloads the files of all the memes concurrently"""
+        for meme in memes:
+            self._submit_meme(meme)
+        self.flush()
+
+    def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
+        """Whether the meme is saved or being saved"""
+        logger.debug(f"Checking if meme {meme.post_id} exists")
+        with self._lock:
+            if meme.post_id in self._pending:
+                return True
+        meme_exists = self._index.contains(self.meme_path, meme.post_id)
+        cover_exists = self._index.contains(self.covers_path, meme.post_id)
+        return all([meme_exists, cover_exists])
+
+    def flush(self) -> None:
+        """Waits for every scheduled download and raises the first error"""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures)
+
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            if len(errors) > 1:
+                logger.error(f"{len(errors)} memes failed to save")
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            asyncio.run_coroutine_threadsafe(
+                self.clients.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._index.save()
+            self.policy.close()
+            if self._manifest:
+                self._manifest.close()
+            if self._owns_clients:
+                self.clients.close()
+
+    async def async_save_meme(self, meme: PostMeme) -> None:
+        """Downloads the cover and the file of the meme, must run on the
+        loop of the repo"""
+        assert meme.post_file_url
+        await asyncio.gather(
+            self._save_file_from_url_and_path(
+                meme.post_cover_photo_url, meme.post_id, self.covers_path),
+            self._save_file_from_url_and_path(
+                meme.post_file_url, meme.post_id, self.meme_path),
+        )
+
+    def _submit_meme(self, meme: PostMeme) -> Future:
+        self._slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(
+            self.async_save_meme(meme), self._loop)
+        with self._lock:
+            self._pending[meme.post_id] = future
+        future.add_done_callback(
+            lambda x: self._on_meme_done(meme.post_id, x))
+        return future
+
+    def _on_meme_done(self, post_id: str, future: Future) -> None:
+        with self._lock:
+            if self._pending.get(post_id) is future:
+                del self._pending[post_id]
+            if (error := future.exception()):
+                logger.error(f"Unable to save Meme ID {post_id}: "
+                             f"{error!r}")
+                self._errors.append(error)
+        self._slots.release()
+
+    async def _save_file_from_url_and_path(self, url: str, file_id: str,
+                                           path: str) -> None:
+        """Downloads the file within the download policy, a failed try
+        resumes where the previous one stopped"""
+        FileStorageRepo._validate_url(url)
+        await self.policy.async_call(
+            url, lambda: self._download_file(url, file_id, path),
+            errors=(DownloadError, httpx.TransportError))
+
+    async def _download_file(self, url: str, file_id: str,
+                             path: str) -> None:
+        """Same as FileStorageRepo._download_file, with the file operations
+        running in the default executor"""
+        url_item = FileStorageRepo._get_url_items_from_url(url)
+        start = time.perf_counter()
+        directory = self.layout.directory(path, file_id)
+        await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+        destination_path = os.path.join(directory,
+                                        file_id + url_item.file_extension)
+        partial_path = destination_path + PARTIAL_SUFFIX
+
+        while True:
+            offset, headers = await asyncio.to_thread(
+                FileStorageRepo._get_resume, partial_path)
+
+            async with self._semaphore:
+                result = await self._download(url, headers, partial_path,
+                                              offset)
+
+            if result is not None:
+                break
+            # the partial file doesn't match the remote one anymore
+            await asyncio.to_thread(FileStorageRepo._remove_partial,
+                                    partial_path)
+
+        size = await asyncio.to_thread(os.path.getsize, partial_path)
+        if result.expected_size is not None and \
+                size != result.expected_size:
+            raise DownloadError(
+                f"Incomplete download of {url}: got {size} of "
+                f"{result.expected_size} bytes, it will resume on the next "
+                "try")
+
+        await asyncio.to_thread(FileStorageRepo._commit, self._blobs,
+                                partial_path, destination_path,
+                                result.sha256)
+        self._index.add(path, file_id)
+        if self._manifest:
+            await asyncio.to_thread(
+                self._manifest.record, path, file_id, destination_path, url,
+                result.sha256, result.content_type)
+
+        offset = result.offset
+        logger.debug(f"File: '{file_id + url_item.file_extension}'"
+                     f" saved in: '{directory}' ({size - offset} bytes"
+                     f"{f' resumed at {offset}' if offset else ''}"
+                     f" in {time.perf_counter() - start:.3f}s)")
+
+    async def _download(self, url: str, headers: Dict[str, str],
+                        partial_path: str, offset: int
+                        ) -> Optional['_Download']:
+        """Streams url to partial_path. Returns None if the partial file
+        has to be restarted"""
+        client = self.clients.async_client
+
+        async with client.stream('GET', url, headers=headers) as response:
+            if offset and (response.status_code == 416 or
+                           response.status_code == 206 and
+                           FileStorageRepo._get_range_start(
+                               response.headers) != offset):
+                return None
+
+            if response.status_code == 206:
+                mode = 'ab'
+                expected_size = FileStorageRepo._get_total_size(
+                    response.headers)
+            elif response.status_code == 200:
+                mode = 'wb'
+                offset = 0
+                expected_size = FileStorageRepo._get_content_length(
+                    response.headers)
+                await asyncio.to_thread(FileStorageRepo._save_validator,
+                                        partial_path, response.headers)
+            else:
+                raise DownloadError(
+                    "Failed to download file. Status code: "
+                    f"{response.status_code}",
+                    status_code=response.status_code,
+                    retry_after=response.headers.get('Retry-After'))
+
+            digest = await asyncio.to_thread(
+                BlobStore.new_hash, partial_path if offset else None) \
+                if self._blobs or self._manifest else None
+            content_type = response.headers.get('Content-Type')
+
+            file: IO[bytes] = await asyncio.to_thread(open, partial_path,
+                                                      mode)
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await asyncio.to_thread(file.write, chunk)
+                    if digest:
+                        digest.update(chunk)
+                await asyncio.to_thread(self._sync_file, file)
+            finally:
+                await asyncio.to_thread(file.close)
+
+        return _Download(expected_size, offset,
+                         digest.hexdigest() if digest else None,
+                         content_type)
+
+    @staticmethod
+    def _sync_file(file: IO[bytes]) -> None:
+        file.flush()
+        os.fsync(file.fileno())
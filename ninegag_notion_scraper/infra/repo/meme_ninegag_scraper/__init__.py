@@ -1 +1,2 @@
 from .page_stream import NineGagStreamScraperRepo  # noqa
+from .feed_http import NineGagFeedHTTPRepo  # noqa
@@ -1,11 +1,16 @@
-import time
 import logging
+from urllib.parse import urlparse
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
 
 from ninegag_notion_scraper.app.use_cases.cookies import CookiesUseCase
 
+from .variants import VariantSelector
+from .waits import AdaptiveWait
+
 logger = logging.getLogger('app.9gag')
 
 
@@ -24,15 +29,23 @@ class BaseScraperRepo:
         self.web_driver = web_driver
         self.at_end = False
         self.cookie_manager = cookie_usecase
-        self.sleep = kwargs.get('sleep') or 0.5
+        self.wait = AdaptiveWait(
+            web_driver, initial_latency=kwargs.get('sleep') or 0.5)
+        self.cookie_dialog_wait = kwargs.get('cookie_dialog_wait') or 1
         self.default_implicity_wait = kwargs.get(
-            'default_implicity_wait') or 1
+            'default_implicity_wait') or 0
+        self.reuse_session = kwargs.get('reuse_session', False)
+        self.variant_selector: VariantSelector = \
+            kwargs.get('variant_selector') or VariantSelector()
 
         self._login_flag = False
         self._attempted_login_flag = False
         self._login_url = 'https://9gag.com/login'
         self._homepage_url = 'https://9gag.com/'
+        self._cookie_domain_url = 'https://9gag.com/robots.txt'
         self._is_setup = False
+        # the consent dialog is only shown on the real pages
+        self._cookie_dialog_pending = False
 
         self.web_driver.implicitly_wait(self.default_implicity_wait)
 
@@ -46,9 +59,31 @@ class BaseScraperRepo:
 
     def __exit__(self, exception_type, exception_value, traceback):
         self._is_setup = False
+        logger.debug(f"Wait ewma {self.wait.ewma:.3f}s, "
+                     f"{self.wait.timeouts} timeouts, latencies: "
+                     f"{[round(x, 3) for x in self.wait.latencies]}")
+        if self.reuse_session:
+            # leave the browser running and logged in for the next run
+            if (service := getattr(self.web_driver, 'service', None)):
+                service.stop()
+            return
         self.web_driver.quit()
 
     def _setup(self):
+        if self.reuse_session and self._is_session_reusable():
+            logger.debug("Reusing the logged in browser session")
+            return
+
+        if self.cookie_manager.is_session_known_good():
+            # cookies can only be added while on the domain, a small page
+            # is enough for that
+            self.web_driver.get(self._cookie_domain_url)
+            self._load_cookies()
+            self._login_flag = True
+            self._cookie_dialog_pending = True
+            logger.debug("Saved session is known good, skipping login checks")
+            return
+
         url = self._homepage_url
         self.web_driver.get(url)
         self._load_cookies()
@@ -60,6 +95,19 @@ class BaseScraperRepo:
             if not self._is_logged_in():
                 self._login()
                 self.web_driver.get(url)
+            else:
+                self.cookie_manager.mark_validated()
+
+    def _is_session_reusable(self) -> bool:
+        """Whether the browser is already on a 9gag page with a logged in
+        session, in which case the cookies and login steps can be skipped"""
+        netloc = urlparse(self.web_driver.current_url).netloc
+        if netloc != '9gag.com' and not netloc.endswith('.9gag.com'):
+            return False
+        try:
+            return self._is_logged_in()
+        except TimeoutException:
+            return False
 
     def _load_cookies(self):
         if (cookies := self.cookie_manager.get_cookies()):
@@ -68,9 +116,11 @@ class BaseScraperRepo:
 
     def _accept_cookie_dialog(self):
         try:
-            dialog = self.web_driver.find_element(
-                By.CSS_SELECTOR, '#qc-cmp2-ui')
-        except NoSuchElementException:
+            dialog = WebDriverWait(
+                self.web_driver, self.cookie_dialog_wait
+            ).until(EC.presence_of_element_located(
+                (By.CSS_SELECTOR, '#qc-cmp2-ui')))
+        except TimeoutException:
             return
 
         accept_button = dialog.find_element(
@@ -79,19 +129,26 @@ class BaseScraperRepo:
             ' > div > button.css-1k47zha')
         accept_button.click()
 
+    def _accept_pending_cookie_dialog(self):
+        """Accepts the cookie dialog on the first page loaded after a setup
+        that skipped the homepage"""
+        if self._cookie_dialog_pending:
+            self._cookie_dialog_pending = False
+            self._accept_cookie_dialog()
+
     def _is_logged_in(self):
-        title_based = self.web_driver.find_element(
-            By.XPATH, '/html/head/title').get_attribute('innerHTML')
+        title_based = self.wait.until(EC.presence_of_element_located((
+            By.XPATH, '/html/head/title'))).get_attribute('innerHTML')
         if title_based == "9GAG - 404 Nothing here":
             self._login_flag = False
             logger.debug("Detected you are NOT logged in")
             if self._attempted_login_flag:
                 raise RuntimeError("Wasn't able to login... Help")
             return False
-        top_nav_based = self.web_driver.find_element(
+        top_nav_based = self.wait.until(EC.presence_of_element_located((
             By.CSS_SELECTOR,
             '#top-nav > div > div > '
-            'div.visitor-function').get_attribute('style')
+            'div.visitor-function'))).get_attribute('style')
         if top_nav_based == "":
             self._login_flag = False
             logger.debug("Detected you are NOT logged in")
@@ -107,12 +164,10 @@ class BaseScraperRepo:
         logger.debug("Attempting to login")
         self.web_driver.get(self._login_url)
 
-        time.sleep(self.sleep)
-
-        username_field = self.web_driver.find_element(
+        username_field = self.wait.until(EC.presence_of_element_located((
             By.CSS_SELECTOR,
             '#signup > form > div > div:nth-child(3) > input[type=text]'
-        )
+        )))
         password_field = self.web_driver.find_element(
             By.CSS_SELECTOR,
             '#signup > form > div > div:nth-child(4) > input[type=password]'
@@ -131,10 +186,14 @@ class BaseScraperRepo:
 
         login_button.click()
 
-        time.sleep(self.sleep)
+        try:
+            self.wait.until(EC.url_changes(self._login_url))
+        except TimeoutException:
+            logger.warning("Still on the login page after submitting")
 
         self._attempted_login_flag = True
 
         self._is_logged_in()
 
         self.cookie_manager.save_cookies(self.web_driver.get_cookies())
+        self.cookie_manager.mark_validated()
@@ -1,9 +1,12 @@
 import os
 import logging
-from typing import List
+from typing import List, Optional
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from .variants import MediaVariant, VariantSelector, parse_srcset
 
 
 logger = logging.getLogger('app.9gag')
@@ -15,6 +18,24 @@ class Base:
         item_id = os.path.basename(url)
         return item_id
 
+    @staticmethod
+    def get_media_url_from_element(element: WebElement,
+                                   attribute: str = 'src'
+                                   ) -> Optional[str]:
+        """Reads a media url from an element, also looking at the lazy
+        loaded ``data-`` attribute and ``srcset`` since images may never be
+        loaded (ex: when the browser blocks them)"""
+        for name in (attribute, f'data-{attribute}'):
+            value = element.get_attribute(name)
+            if value and not value.startswith('data:'):
+                return value
+
+        for name in ('srcset', 'data-srcset'):
+            if (value := element.get_attribute(name)):
+                return value.split(',')[0].strip().split(' ')[0]
+
+        return None
+
     @staticmethod
     def get_tags_from_article(article: WebElement) -> List[str | None]:
         try:
@@ -39,16 +60,21 @@ class Base:
         cover_photo = None
 
         try:
-            cover_photo = article.find_element(
-                By.CSS_SELECTOR, '.post-container * > picture > img'
-            ).get_attribute('src')
+            cover_photo = Base.get_media_url_from_element(
+                article.find_element(
+                    By.CSS_SELECTOR, '.post-container * > picture > img'
+                )
+            )
         except NoSuchElementException:
             pass
 
         try:
-            cover_photo = article.find_element(
-                By.CSS_SELECTOR, '.post-container * > video'
-            ).get_attribute('poster')
+            cover_photo = Base.get_media_url_from_element(
+                article.find_element(
+                    By.CSS_SELECTOR, '.post-container * > video'
+                ),
+                'poster'
+            )
         except NoSuchElementException:
             pass
 
@@ -65,7 +91,10 @@ class Base:
         raise NotImplementedError
 
     @staticmethod
-    def get_file_url_from_article(article: WebElement) -> str:
+    def get_file_variants_from_article(article: WebElement
+                                       ) -> List[MediaVariant]:
+        """Every source of the video of the post, or of its image when it
+        has no video"""
         try:
             post_view_element = article.find_element(
                 By.CLASS_NAME, 'post-view')
@@ -75,35 +104,40 @@ class Base:
                            )
             raise error
 
-        video_url = None
-        image_url = None
+        variants = [
+            MediaVariant.from_source(url, source.get_attribute('type'))
+            for source in post_view_element.find_elements(
+                By.XPATH, "video/source")
+            if (url := Base.get_media_url_from_element(source))
+        ]
+        if variants:
+            return variants
 
-        try:
-            video_url = post_view_element.find_element(
-                By.XPATH,
-                "video/source[@type='video/mp4']").get_attribute('src')
-        except NoSuchElementException:
-            pass
+        for source in post_view_element.find_elements(
+                By.XPATH, "picture/source"):
+            srcset = source.get_attribute('srcset') or \
+                source.get_attribute('data-srcset') or ''
+            for variant in parse_srcset(srcset):
+                variant.mime_type = source.get_attribute('type')
+                variants.append(variant)
 
-        try:
-            image_url = post_view_element.find_element(
-                By.XPATH,
-                "picture/img").get_attribute('src')
-        except NoSuchElementException:
-            pass
+        for image in post_view_element.find_elements(By.XPATH,
+                                                     "picture/img"):
+            if (url := Base.get_media_url_from_element(image)):
+                variants.append(MediaVariant.from_source(url))
+
+        return variants
 
-        if not video_url and not image_url:
+    @staticmethod
+    def get_file_url_from_article(article: WebElement, post_id: str,
+                                  selector: VariantSelector) -> str:
+        variants = Base.get_file_variants_from_article(article)
+
+        if not (url := selector.select(post_id, variants)):
             logger.warning('Unable to find image or video in post view')
             raise NoSuchElementException
-        if video_url and image_url:
-            logger.warning('Found both an image and a video... not possible')
-            raise ValueError
 
-        if video_url:
-            return video_url
-        else:
-            assert image_url
-            return image_url
+        return url
 
 
 class StreamArticle(Base):
@@ -151,3 +185,118 @@ class SinglePageArticle(Base):
             raise error
 
         return title
+
+
+STREAM_ARTICLES_SCRIPT = """
+const stream = arguments[0];
+
+function mediaUrl(element, attribute) {
+    for (const name of [attribute, 'data-' + attribute]) {
+        const value = element.getAttribute(name);
+        if (value && !value.startsWith('data:')) {
+            return new URL(value, document.baseURI).href;
+        }
+    }
+    for (const name of ['srcset', 'data-srcset']) {
+        const value = element.getAttribute(name);
+        if (value) {
+            const candidate = value.split(',')[0].trim().split(' ')[0];
+            return new URL(candidate, document.baseURI).href;
+        }
+    }
+    return null;
+}
+
+function parseSrcset(srcset, type) {
+    return srcset.split(',').map(x => x.trim().split(/\\s+/)).filter(
+        x => x[0]
+    ).map(x => ({
+        url: new URL(x[0], document.baseURI).href,
+        type: type,
+        width: /^\\d+w$/.test(x[1] || '') ? parseInt(x[1]) : null
+    }));
+}
+
+function getFileVariants(article) {
+    const postView = article.querySelector('.post-view');
+    if (!postView) {
+        return [];
+    }
+    const videos = Array.from(
+        postView.querySelectorAll(':scope > video > source')
+    ).map(source => ({
+        url: mediaUrl(source, 'src'),
+        type: source.getAttribute('type'),
+        width: null
+    })).filter(x => x.url);
+    if (videos.length) {
+        return videos;
+    }
+    const images = [];
+    postView.querySelectorAll(':scope > picture > source').forEach(
+        source => images.push(...parseSrcset(
+            source.getAttribute('srcset')
+            || source.getAttribute('data-srcset') || '',
+            source.getAttribute('type')))
+    );
+    postView.querySelectorAll(':scope > picture > img').forEach(image => {
+        const url = mediaUrl(image, 'src');
+        if (url) {
+            images.push({url: url, type: null, width: null});
+        }
+    });
+    return images;
+}
+
+function getCoverPhoto(article) {
+    let cover = null;
+    const image = article.querySelector('.post-container * > picture > img');
+    if (image) {
+        cover = mediaUrl(image, 'src');
+    }
+    const video = article.querySelector('.post-container * > video');
+    if (video) {
+        cover = mediaUrl(video, 'poster');
+    }
+    return cover;
+}
+
+return Array.from(stream.querySelectorAll('article')).map(article => {
+    try {
+        const link = article.querySelector('article > header > a');
+        return {
+            tags: Array.from(
+                article.querySelectorAll('article > div.post-tags > a')
+            ).map(tag => tag.innerHTML),
+            url: link ? link.href : null,
+            title: link ? link.innerText.trim() : null,
+            cover: getCoverPhoto(article),
+            files: getFileVariants(article)
+        };
+    } catch (error) {
+        return null;
+    }
+});
+"""
+
+
+class StreamScript:
+    """Extracts every article of a stream with a single ``execute_script``
+    instead of several WebDriver round trips per article"""
+
+    @staticmethod
+    def get_articles_data(web_driver: WebDriver,
+                          stream: WebElement
+                          ) -> List[Optional[dict]]:
+        """Returns one entry per ``<article>`` in the stream, in DOM order.
+        An entry is ``None`` when the script was not able to extract every
+        field of the article. The ``files`` of an entry are the variants of
+        its media, as dicts with a ``url``, ``type`` and ``width``"""
+        data = web_driver.execute_script(STREAM_ARTICLES_SCRIPT, stream)
+
+        return [
+            item if item and all(
+                item.get(key) for key in ('url', 'title', 'cover', 'files'))
+            else None
+            for item in data
+        ]
@@ -0,0 +1,195 @@
+import html
+import logging
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+from ninegag_notion_scraper.app.entities.meme import PostMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo \
+    import GetPostMemesRepo
+from ninegag_notion_scraper.app.use_cases.cookies import CookiesUseCase
+from ninegag_notion_scraper.infra.http_client import HTTPClients
+from ninegag_notion_scraper.infra.user_agent import get_user_agent
+
+from .base import ScraperNotSetup
+from .variants import MediaVariant, VariantSelector
+
+
+logger = logging.getLogger('app.9gag')
+
+
+class FeedURLNotSupported(ValueError):
+    pass
+
+
+class NineGagFeedHTTPRepo(GetPostMemesRepo):
+    """Pages through a 9gag feed with its JSON API, without a browser
+
+    The requests go through the 'clients' kwarg, shared HTTPClients,
+    else through clients of its own loaded with the cookies of
+    cookie_usecase"""
+
+    def __init__(self,
+                 url: str,
+                 cookie_usecase: CookiesUseCase,
+                 **kwargs) -> None:
+        self.at_end = False
+        self.cookie_manager = cookie_usecase
+        self.timeout = kwargs.get('timeout') or 10
+        self.user_agent = kwargs.get('user_agent') or get_user_agent()
+        self.variant_selector: VariantSelector = \
+            kwargs.get('variant_selector') or VariantSelector()
+
+        self._api_url = self.get_api_url_from_feed_url(url)
+        self._owns_clients = kwargs.get('clients') is None
+        self._clients: HTTPClients = kwargs.get('clients') or \
+            HTTPClients(cookie_usecase.get_cookies)
+        self._headers = {
+            'User-Agent': self.user_agent,
+            'Accept': 'application/json',
+        }
+        self._cursor: Optional[str] = None
+        self._page: Optional[dict] = None
+        self._current_page_num = 0
+        self._is_setup = False
+
+    def __enter__(self):
+        self._is_setup = True
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self._is_setup = False
+        if self._owns_clients:
+            self._clients.close()
+
+    def get_memes(self) -> List[PostMeme]:
+        """Return memes from the current feed page"""
+        if not self._is_setup:
+            raise ScraperNotSetup
+        if self.at_end:
+            logger.warning("Reached the end of the feed, no more memes "
+                           "to give")
+            return []
+
+        page = self._get_page()
+
+        memes = []
+
+        for post in page['posts']:
+            if (meme := self._get_meme_from_post(post)):
+                memes.append(meme)
+
+        return memes
+
+    def next(self) -> int:
+        """Follows the feed cursor to the next page"""
+        if self.at_end:
+            logger.warning("Reached the end of the feed, no more pages")
+            return self._current_page_num
+
+        page = self._get_page()
+
+        if not page['posts'] or not page.get('nextCursor'):
+            logger.info("End of the feed reached")
+            self.at_end = True
+            return self._current_page_num
+
+        self._cursor = page['nextCursor']
+        self._page = None
+        self._current_page_num += 1
+        return self._current_page_num
+
+    @staticmethod
+    def get_api_url_from_feed_url(url: str) -> str:
+        """Translates the url of a feed as seen in the browser to the url
+        of the API serving its posts
+
+        Supports ``/u/<username>/<type>``, ``/interest/<section>[/<type>]``
+        and ``/<type>`` (ex: hot, trending, fresh)"""
+        url_parse = urlparse(url)
+        base = f"{url_parse.scheme}://{url_parse.netloc}/v1"
+        parts = [x for x in url_parse.path.split('/') if x]
+
+        if len(parts) == 3 and parts[0] == 'u':
+            return f"{base}/user-posts/username/{parts[1]}/type/{parts[2]}"
+        if len(parts) in (2, 3) and parts[0] == 'interest':
+            feed_type = parts[2] if len(parts) == 3 else 'hot'
+            return f"{base}/group-posts/group/{parts[1]}/type/{feed_type}"
+        if len(parts) == 1:
+            return f"{base}/feed-posts/type/{parts[0]}"
+        if not parts:
+            return f"{base}/feed-posts/type/home"
+
+        raise FeedURLNotSupported(f"Feed url is not supported {url}")
+
+    def _get_page(self) -> dict:
+        if self._page is not None:
+            return self._page
+
+        url = self._api_url
+        if self._cursor:
+            url = f"{url}?{self._cursor}"
+
+        response = self._clients.client.get(url, headers=self._headers,
+                                            timeout=self.timeout)
+        response.raise_for_status()
+
+        payload = response.json()
+        if payload.get('meta', {}).get('status') != 'Success':
+            raise RuntimeError(f"Unable to load feed page {url}: "
+                               f"{payload.get('meta')}")
+
+        self._page = payload['data']
+        return self._page
+
+    @staticmethod
+    def get_file_variants_from_post(post: dict) -> List[MediaVariant]:
+        images = post.get('images', {})
+        keys: Tuple[str, ...]
+
+        if post.get('type') in ('Animated', 'Video'):
+            image = images.get('image460sv', {})
+            keys = ('url', 'av1Url', 'h265Url', 'vp9Url', 'vp8Url')
+        elif post.get('type') == 'Photo':
+            image = images.get('image700', {})
+            keys = ('url', 'webpUrl')
+        else:
+            return []
+
+        return [
+            MediaVariant.from_source(image[key], width=image.get('width'))
+            for key in keys if image.get(key)
+        ]
+
+    @staticmethod
+    def get_cover_photo_from_post(post: dict) -> Optional[str]:
+        images = post.get('images', {})
+
+        for key in ('image460', 'image700'):
+            if (url := images.get(key, {}).get('url')):
+                return url
+        return None
+
+    def _get_meme_from_post(self, post: dict) -> Optional[PostMeme]:
+        tags = [html.unescape(x['key']) for x in post.get('tags', [])]
+
+        if post.get('promoted') or 'Promoted' in tags:
+            logger.debug("Skipping Promoted Post")
+            return None
+
+        file_url = self.variant_selector.select(
+            post['id'], self.get_file_variants_from_post(post))
+        cover_url = self.get_cover_photo_from_post(post)
+
+        if not file_url or not cover_url:
+            logger.warning("Skipping post %s because of missing media",
+                           post.get('id'))
+            return None
+
+        return PostMeme(
+            post_title=html.unescape(post.get('title', '')),
+            post_id=post['id'],
+            post_url=post['url'],
+            post_tags=tags,
+            post_cover_photo_url=cover_url,
+            post_file_url=file_url
+        )
@@ -1,7 +1,8 @@
 import logging
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, \
+    TimeoutException
 
 
 from ninegag_notion_scraper.app.entities.meme import PostMeme
@@ -32,6 +33,13 @@ class NineGagSinglePageScraperRepo(BaseScraperRepo, GetMemeRepo):
             raise ScraperNotSetup
 
         self.web_driver.get(url)
+        self._accept_pending_cookie_dialog()
+
+        try:
+            self.wait.until(lambda driver: driver.find_elements(
+                By.CSS_SELECTOR, "#individual-post, div.message > h1"))
+        except TimeoutException:
+            logger.warning(f"Timed out waiting for the post page {url}")
 
         try:
             section_element = self.web_driver.find_element(
@@ -43,19 +51,24 @@ class NineGagSinglePageScraperRepo(BaseScraperRepo, GetMemeRepo):
             raise
 
         try:
-            article = section_element.find_element(By.CSS_SELECTOR, "article")
-        except NoSuchElementException:
+            # the article is rendered by 9gag's js after the section
+            article = self.wait.until(lambda _: section_element.find_element(
+                By.CSS_SELECTOR, "article"))
+        except TimeoutException:
             logger.error("Unable to find article element on page")
             raise
 
+        post_id = SinglePageArticle.get_item_id_from_url(url)
+
         return PostMeme(
             post_title=SinglePageArticle.get_title_from_article(article),
-            post_id=SinglePageArticle.get_item_id_from_url(url),
+            post_id=post_id,
             post_url=url,
             post_tags=SinglePageArticle.get_tags_from_article(article),
             post_cover_photo_url=SinglePageArticle.
             get_cover_photo_from_article(article),
-            post_file_url=SinglePageArticle.get_file_url_from_article(article)
+            post_file_url=SinglePageArticle.get_file_url_from_article(
+                article, post_id, self.variant_selector)
         )
 
     def _is_404_page(self):
@@ -1,11 +1,13 @@
 import time
 import logging
-from typing import List
+from typing import List, Optional
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, \
+    TimeoutException
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.support import expected_conditions as EC
 
 from ninegag_notion_scraper.app.entities.meme import PostMeme
 from ninegag_notion_scraper.app.interfaces.meme_repo \
@@ -13,11 +15,32 @@ from ninegag_notion_scraper.app.interfaces.meme_repo \
 from ninegag_notion_scraper.app.use_cases.cookies import CookiesUseCase
 
 from .base import BaseScraperRepo, ScraperNotSetup
-from .element_article import StreamArticle
+from .element_article import StreamArticle, StreamScript
+from .variants import MediaVariant
 
 logger = logging.getLogger('app.9gag')
 
 
+PRUNE_STREAM_SCRIPT = """
+const stream = arguments[0];
+stream.querySelectorAll('video').forEach(video => {
+    video.pause();
+    video.removeAttribute('src');
+    video.querySelectorAll('source').forEach(source => source.remove());
+    video.load();
+});
+stream.style.height = stream.offsetHeight + 'px';
+stream.replaceChildren();
+"""
+
+DOM_METRICS_SCRIPT = """
+return {
+    nodes: document.getElementsByTagName('*').length,
+    heap: performance.memory ? performance.memory.usedJSHeapSize : null
+};
+"""
+
+
 class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
     """A class that handles all the web scraping on 9gag"""
 
@@ -37,6 +60,10 @@ class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
         self._at_bottom_flag = self.at_end
         self._list_view: WebElement
         self._current_stream_num = 0
+        self.bulk_extraction = kwargs.get('bulk_extraction', True)
+        self.prune_streams = kwargs.get('prune_streams', False)
+        self.measure_dom = kwargs.get('measure_dom', False)
+        self.dom_metrics: List[dict] = []
 
     def get_memes(self) -> List[PostMeme]:
         """Return memes from current stream"""
@@ -47,35 +74,20 @@ class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
             return []
 
         stream = self._get_stream(self._current_stream_num)
-        articles = self._get_articles_from_stream(stream)
 
-        elements = []
+        if self.bulk_extraction:
+            elements = self._get_memes_from_script(stream)
+        else:
+            elements = []
 
-        for article in articles:
-            try:
-                tags = StreamArticle.get_tags_from_article(article)
-
-                if 'Promoted' in tags:
-                    logger.debug("Skipping Promoted Post")
-                    continue
-
-                url = StreamArticle.get_url_from_article(article)
-
-                articledata = PostMeme(
-                    post_title=StreamArticle.get_title_from_article(article),
-                    post_id=StreamArticle.get_item_id_from_url(url),
-                    post_url=url,
-                    post_tags=StreamArticle.get_tags_from_article(article),
-                    post_cover_photo_url=StreamArticle.
-                    get_cover_photo_from_article(article),
-                    post_file_url=StreamArticle.get_file_url_from_article(
-                        article)
-                )
-            except NoSuchElementException:
-                logger.warning("Skipping Article because of missing element")
-                continue
-
-            elements.append(articledata)
+            for article in self._get_articles_from_stream(stream):
+                if (articledata := self._get_meme_from_article(article)):
+                    elements.append(articledata)
+
+        if self.prune_streams:
+            self._prune_stream(stream)
+        if self.measure_dom:
+            self._measure_dom()
 
         return elements
 
@@ -88,16 +100,111 @@ class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
         self._current_stream_num += 1
         self._scroll_to_spinner()
 
-        if not self._is_loader_spinning():
+        if not self._wait_for_stream(self._current_stream_num):
             self._at_bottom_flag = True
+            self.at_end = True
 
         return self._current_stream_num
 
     def _setup(self) -> None:
         super()._setup()
         self.web_driver.get(self._stream_url)
+        self._accept_pending_cookie_dialog()
         self._list_view = self._get_list_view()
 
+        if not self._wait_for_stream(self._current_stream_num):
+            self._at_bottom_flag = True
+            self.at_end = True
+
+    def _prune_stream(self, stream: WebElement) -> None:
+        """Blanks an already processed stream so the browser can release its
+        images and videos. The stream keeps its height so the scroll
+        position and the loader below it are left untouched"""
+        self.web_driver.execute_script(PRUNE_STREAM_SCRIPT, stream)
+        logger.debug(f"Pruned stream {self._current_stream_num}")
+
+    def _measure_dom(self) -> dict:
+        metrics = self.web_driver.execute_script(DOM_METRICS_SCRIPT)
+        metrics['stream'] = self._current_stream_num
+        self.dom_metrics.append(metrics)
+        logger.debug(f"Stream {metrics['stream']}: {metrics['nodes']} DOM "
+                     f"nodes, JS heap {metrics['heap']} bytes")
+        return metrics
+
+    def _get_memes_from_script(self, stream: WebElement) -> List[PostMeme]:
+        """Extract the whole stream in one round trip, falling back to the
+        per element extraction for articles the script could not parse"""
+        articles_data = StreamScript.get_articles_data(self.web_driver,
+                                                       stream)
+        articles: Optional[List[WebElement]] = None
+
+        elements = []
+
+        for index, data in enumerate(articles_data):
+            if data is None:
+                if articles is None:
+                    articles = self._get_articles_from_stream(stream)
+                logger.debug(f"Falling back to element extraction for "
+                             f"article {index} of stream "
+                             f"{self._current_stream_num}")
+                articledata = self._get_meme_from_article(articles[index])
+            else:
+                articledata = self._get_meme_from_data(data)
+
+            if articledata:
+                elements.append(articledata)
+
+        return elements
+
+    def _get_meme_from_data(self, data: dict) -> Optional[PostMeme]:
+        if 'Promoted' in data['tags']:
+            logger.debug("Skipping Promoted Post")
+            return None
+
+        post_id = StreamArticle.get_item_id_from_url(data['url'])
+        variants = [
+            MediaVariant.from_source(x['url'], x.get('type'), x.get('width'))
+            for x in data['files']
+        ]
+        file_url = self.variant_selector.select(post_id, variants)
+        assert file_url
+
+        return PostMeme(
+            post_title=data['title'],
+            post_id=post_id,
+            post_url=data['url'],
+            post_tags=data['tags'],
+            post_cover_photo_url=data['cover'],
+            post_file_url=file_url
+        )
+
+    def _get_meme_from_article(self,
+                               article: WebElement
+                               ) -> Optional[PostMeme]:
+        try:
+            tags = StreamArticle.get_tags_from_article(article)
+
+            if 'Promoted' in tags:
+                logger.debug("Skipping Promoted Post")
+                return None
+
+            url = StreamArticle.get_url_from_article(article)
+            post_id = StreamArticle.get_item_id_from_url(url)
+
+            return PostMeme(
+                post_title=StreamArticle.get_title_from_article(article),
+                post_id=post_id,
+                post_url=url,
+                post_tags=tags,
+                post_cover_photo_url=StreamArticle.
+                get_cover_photo_from_article(article),
+                post_file_url=StreamArticle.get_file_url_from_article(
+                    article, post_id, self.variant_selector)
+            )
+        except NoSuchElementException:
+            logger.warning("Skipping Article because of missing element")
+            return None
+
     def _get_articles_from_stream(self,
                                   stream: WebElement
                                   ) -> List[WebElement]:
@@ -112,11 +219,11 @@ class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
 
     def _get_list_view(self) -> WebElement:
         try:
-            list_view = self.web_driver.find_element(
+            list_view = self.wait.until(EC.presence_of_element_located((
                 By.CSS_SELECTOR,
                 '#list-view-2'
-            )
-        except NoSuchElementException as error:
+            )))
+        except TimeoutException as error:
             logger.warning("Unable to find list_view on page\n %s",
                            self.web_driver.page_source)
             raise error
@@ -146,13 +253,53 @@ class NineGagStreamScraperRepo(BaseScraperRepo, GetPostMemesRepo):
 
     def _scroll_by(self, scroll=500):
         self.web_driver.execute_script(f"window.scrollBy(0,{scroll})", "")
-        time.sleep(self.sleep)
 
     def _scroll_to_spinner(self):
         element = self._get_loader_element()
         actions = ActionChains(self.web_driver)
         actions.scroll_to_element(element).perform()
-        time.sleep(self.sleep)
+
+    def _wait_for_stream(self, stream_num: int) -> bool:
+        """Waits until either the stream is attached to the list view or the
+        loader reached its end state. Returns whether the stream exists
+
+        A wait timing out while the loader still spins is retried until
+        max_timeout seconds have passed, then TimeoutException is raised"""
+
+        def stream_or_end(_) -> Optional[str]:
+            if self._list_view.find_elements(By.CSS_SELECTOR,
+                                             f'#stream-{stream_num}'):
+                return 'stream'
+            loader = self._list_view.find_elements(By.CSS_SELECTOR,
+                                                   'div.loading > a')
+            if loader and 'end' in \
+                    (loader[0].get_attribute('class') or '').split(' '):
+                return 'end'
+            return None
+
+        start = time.perf_counter()
+
+        while True:
+            try:
+                state = self.wait.until(stream_or_end)
+                break
+            except TimeoutException:
+                if not self._is_loader_spinning():
+                    logger.info("End of the page reached")
+                    return False
+                waited = time.perf_counter() - start
+                if waited >= self.wait.max_timeout:
+                    logger.warning(f"Stream {stream_num} still not loaded "
+                                   f"after {waited:.2f}s, giving up")
+                    raise
+                logger.warning(f"Stream {stream_num} not loaded after "
+                               f"{waited:.2f}s, the loader is still "
+                               "spinning")
+
+        if state == 'end':
+            logger.info("End of the page reached")
+            return False
+        return True
 
     def _get_loader_element(self) -> WebElement:
         try:
@@ -0,0 +1,167 @@
+import os
+import logging
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+import httpx
+
+from ninegag_notion_scraper.infra.http_client import HTTPClients
+
+
+logger = logging.getLogger('app.9gag')
+
+# what 9gag puts in the types and file names of its sources, the first
+# match wins so the more specific ones come first
+CODEC_HINTS = [
+    ('av1', ('av01', 'av1')),
+    ('h265', ('hvc1', 'hev1', 'h265', 'hevc')),
+    ('vp9', ('vp09', 'vp9')),
+    ('vp8', ('vp8',)),
+    ('h264', ('avc1', 'h264')),
+]
+EXTENSION_CODECS = {
+    '.mp4': 'h264',
+    '.webm': 'vp8',
+    '.webp': 'webp',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.gif': 'gif',
+}
+
+POLICIES = ('codec', 'smallest', 'best')
+# what was downloaded before the variants could be chosen
+DEFAULT_CODEC_ORDER = ('h264', 'jpeg')
+
+
+@dataclass
+class MediaVariant:
+    url: str
+    mime_type: Optional[str] = None
+    codec: Optional[str] = None
+    width: Optional[int] = None
+    size: Optional[int] = None
+
+    @classmethod
+    def from_source(cls, url: str, mime_type: Optional[str] = None,
+                    width: Optional[int] = None) -> 'MediaVariant':
+        return cls(url, mime_type, get_codec(url, mime_type), width)
+
+
+def get_codec(url: str, mime_type: Optional[str] = None) -> Optional[str]:
+    """Guesses the codec of a source from its type, ex:
+    'video/mp4; codecs="av01.0.05M.08"', or else from its file name, ex:
+    aVp9x2q_460svav1.mp4, whose post id is left out"""
+    path = urlparse(url).path.lower()
+    name = os.path.basename(path)
+    suffix = name.rsplit('_', 1)[1] if '_' in name else ''
+    hints = f"{(mime_type or '').lower()} {suffix}"
+
+    for codec, names in CODEC_HINTS:
+        if any(name in hints for name in names):
+            return codec
+
+    return EXTENSION_CODECS.get(os.path.splitext(path)[1])
+
+
+def parse_srcset(srcset: str) -> List[MediaVariant]:
+    """The candidates of a srcset, ex: 'a.jpg 460w, b.jpg 700w'"""
+    variants = []
+
+    for candidate in srcset.split(','):
+        if not (parts := candidate.strip().split()):
+            continue
+        width = None
+        if len(parts) > 1 and parts[1].endswith('w') and \
+                parts[1][:-1].isdigit():
+            width = int(parts[1][:-1])
+        variants.append(MediaVariant.from_source(parts[0], width=width))
+
+    return variants
+
+
+class VariantSelector:
+    """Picks which variant of the media of a post is downloaded
+
+    Policies:
+        codec: the first variant with the first available codec of
+            codec_order, or the first variant if none is available
+        smallest: the variant with the fewest bytes
+        best: the widest variant, then the one with the most bytes
+
+    Sizes come from HEAD probes, only sent by the policies needing them.
+    The choice is cached per post, so a post seen twice is probed once
+
+    Args:
+        policy (str): one of POLICIES
+        codec_order (Sequence[str]): preferred codecs, ex: av1, vp9, h264
+        clients (HTTPClients): used by the probes
+        timeout (float): seconds before a probe is given up
+    """
+
+    def __init__(self,
+                 policy: str = 'codec',
+                 codec_order: Sequence[str] = DEFAULT_CODEC_ORDER,
+                 clients: Optional[HTTPClients] = None,
+                 timeout: float = 5) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown variant policy '{policy}', "
+                             f"expected one of {POLICIES}")
+        self.policy = policy
+        self.codec_order = list(codec_order)
+        self.timeout = timeout
+        self._clients = clients or HTTPClients()
+        self._lock = Lock()
+        self._cache: Dict[str, str] = {}
+
+    def select(self, post_id: str,
+               variants: List[MediaVariant]) -> Optional[str]:
+        """The url of the chosen variant, None when there is none"""
+        with self._lock:
+            if post_id in self._cache:
+                return self._cache[post_id]
+
+        if not variants:
+            return None
+
+        if self.policy == 'codec':
+            variant = self._by_codec(variants)
+        else:
+            for x in variants:
+                if x.size is None:
+                    x.size = self.probe(x.url)
+            if self.policy == 'smallest':
+                variant = min(variants, key=lambda x: (
+                    x.size is None, x.size or 0))
+            else:
+                variant = max(variants, key=lambda x: (
+                    x.width or 0, x.size or 0))
+
+        logger.debug(f"Picked the {variant.codec} variant of post "
+                     f"{post_id} out of {len(variants)} ({variant.size} "
+                     "bytes)")
+
+        with self._lock:
+            self._cache[post_id] = variant.url
+        return variant.url
+
+    def probe(self, url: str) -> Optional[int]:
+        """The size of the file at url, None if unknown"""
+        try:
+            response = self._clients.client.head(url, timeout=self.timeout)
+        except httpx.HTTPError as error:
+            logger.debug(f"Unable to probe {url}: {error!r}")
+            return None
+
+        length = response.headers.get('Content-Length')
+        if not response.is_success or not length or not length.isdigit():
+            return None
+        return int(length)
+
+    def _by_codec(self, variants: List[MediaVariant]) -> MediaVariant:
+        for codec in self.codec_order:
+            for variant in variants:
+                if variant.codec == codec:
+                    return variant
+        return variants[0]
@@ -0,0 +1,78 @@
+import time
+import logging
+from collections import deque
+from typing import Callable, Deque, TypeVar
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.support.wait import WebDriverWait
+
+
+logger = logging.getLogger('app.9gag')
+
+T = TypeVar('T')
+
+
+class AdaptiveWait:
+    """Explicit waits whose timeout and polling interval follow an
+    exponentially weighted moving average (EWMA) of the observed latencies
+
+    Args:
+        web_driver (WebDriver): driver the conditions are evaluated with
+        initial_latency (float): latency assumed before anything is observed
+        alpha (float): weight of the latest observation in the EWMA
+        timeout_factor (float): timeout is this many times the EWMA
+        min_timeout (float): lower bound of the timeout
+        max_timeout (float): upper bound of the timeout
+        history (int): number of latencies kept in ``latencies``
+    """
+
+    def __init__(self,
+                 web_driver: WebDriver,
+                 initial_latency: float = 0.5,
+                 alpha: float = 0.3,
+                 timeout_factor: float = 4,
+                 min_timeout: float = 2,
+                 max_timeout: float = 30,
+                 history: int = 50) -> None:
+        self.web_driver = web_driver
+        self.alpha = alpha
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.ewma = initial_latency
+        self.latencies: Deque[float] = deque(maxlen=history)
+        self.timeouts = 0
+
+    @property
+    def timeout(self) -> float:
+        return min(max(self.ewma * self.timeout_factor, self.min_timeout),
+                   self.max_timeout)
+
+    @property
+    def poll_frequency(self) -> float:
+        return min(max(self.ewma / 10, 0.05), 0.5)
+
+    def until(self, condition: Callable[[WebDriver], T],
+              message: str = '') -> T:
+        """Waits for condition to return a truthy value and records how
+        long it took. Raises TimeoutException when it never does"""
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(
+                self.web_driver,
+                self.timeout,
+                poll_frequency=self.poll_frequency
+            ).until(condition, message)
+        except TimeoutException:
+            self.timeouts += 1
+            self.observe(time.perf_counter() - start)
+            raise
+
+        self.observe(time.perf_counter() - start)
+        return result
+
+    def observe(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.ewma = self.alpha * latency + (1 - self.alpha) * self.ewma
+        logger.debug(f"Wait took {latency:.3f}s (ewma {self.ewma:.3f}s, "
+                     f"timeout {self.timeout:.2f}s)")
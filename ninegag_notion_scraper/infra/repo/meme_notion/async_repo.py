@@ -0,0 +1,275 @@
+"""Notion repos keeping several requests in flight"""
+
+import asyncio
+import logging
+from concurrent.futures import Future
+from threading import BoundedSemaphore, Lock, Thread
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, \
+    Optional, Set, TypeVar
+from notion_client import AsyncClient, Client
+
+from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo \
+    import GetDBMemesRepo, SaveMemeRepo, UpdateMemeRepo
+
+from .base import Properties, NotionBase
+from .converters import TagsConverter
+from .get_memes import NotionGetMemes
+from .mirror import NotionMirror
+from .post_id_index import NotionPostIDIndex
+from .retry_policy import NotionRetryPolicy
+from .save_meme import NotionSaveMeme
+
+
+logger = logging.getLogger("app.notion")
+
+T = TypeVar('T')
+
+
+class _LoopThread:
+    """An event loop running in a daemon thread"""
+
+    def __init__(self, name: str) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self.loop.run_forever, name=name,
+                              daemon=True)
+        self._thread.start()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> 'Future[T]':
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class _AsyncNotionBase(NotionBase):
+    """Validates the database with the sync client, then sends the requests
+    with async_client on a loop of its own, at most max_in_flight at once
+    and each through policy"""
+
+    def __init__(self, client: Client, async_client: AsyncClient,
+                 database_id: str, policy: Optional[NotionRetryPolicy],
+                 max_in_flight: int, name: str) -> None:
+        NotionBase.__init__(self, client, database_id, policy)
+        self._async_client = async_client
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._loop = _LoopThread(name)
+
+    async def _request(
+            self, func: Callable[[], Awaitable[Any]],
+            idempotent: bool = True,
+            verify: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        async with self._semaphore:
+            return await self.policy.async_call(func, idempotent, verify)
+
+    def _close_loop(self) -> None:
+        self._loop.submit(self._async_client.aclose()).result()
+        self._loop.stop()
+
+
+class AsyncNotionSaveMeme(_AsyncNotionBase, SaveMemeRepo, UpdateMemeRepo):
+    """Saves the memes like NotionSaveMeme, but save_meme and update_meme
+    only schedule their request and return, waiting when max_pending are
+    already scheduled. Errors are logged as they happen and the first one
+    is raised by flush() or close()
+
+    Args:
+        client (Client): validates the database and loads the post ids
+        async_client (AsyncClient): creates and updates the pages
+        database_id (str): the meme database
+        policy (NotionRetryPolicy): shared with the other notion repos
+        max_in_flight (int): requests sent at once
+        max_pending (int): requests scheduled before the calls block
+        mirror (NotionMirror): see NotionSaveMeme
+    """
+
+    def __init__(self, client: Client, async_client: AsyncClient,
+                 database_id: str,
+                 policy: Optional[NotionRetryPolicy] = None,
+                 max_in_flight: int = 8,
+                 max_pending: int = 256,
+                 mirror: Optional[NotionMirror] = None) -> None:
+        _AsyncNotionBase.__init__(self, client, async_client, database_id,
+                                  policy, max_in_flight, 'notion-save')
+        self._index: NotionMirror | NotionPostIDIndex = \
+            mirror or NotionPostIDIndex(
+                client, database_id,
+                self._property_ids.get(Properties.EXTERNAL_REF.value['name']),
+                policy=self.policy)
+        self._slots = BoundedSemaphore(max_pending)
+        self._lock = Lock()
+        self._pending: Set[Future] = set()
+        self._creating: Set[str] = set()
+        self._errors: List[BaseException] = []
+
+    def save_meme(self,
+                  meme: PostMeme,
+                  update: bool = False
+                  ) -> None:
+        content = NotionSaveMeme._page_content(
+            meme.post_title, meme.post_id, meme.post_url, meme.post_tags,
+            meme.post_cover_photo_url)
+
+        if not (page_id := self._index.page_id(meme.post_id)):
+            self._submit(f"Meme ID {meme.post_id}", lambda: self._request(
+                lambda: self._async_client.pages.create(
+                    parent={"database_id": self._db_id}, **content),
+                idempotent=False,
+                verify=lambda: self._find_page(meme.post_id)),
+                creating=meme.post_id)
+        elif update:
+            self._submit(f"Meme ID {meme.post_id}", lambda: self._request(
+                lambda: self._async_client.pages.update(
+                    page_id=page_id, **content)))
+
+    def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
+        """Whether the meme has a page or is being saved"""
+        with self._lock:
+            if meme.post_id in self._creating:
+                return True
+        return meme.post_id in self._index
+
+    def update_meme(self, id: str, tags: list) -> None:
+        self._submit(f"page {id}", lambda: self._request(
+            lambda: self._async_client.pages.update(
+                page_id=id, properties={**TagsConverter.encode(tags)})))
+
+    def flush(self) -> None:
+        """Waits for every scheduled request and raises the first error"""
+        with self._lock:
+            futures = list(self._pending)
+        for future in futures:
+            future.exception()
+
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            if len(errors) > 1:
+                logger.error(f"{len(errors)} notion requests failed")
+            raise errors[0]
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._close_loop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def _submit(self, label: str,
+                request: Callable[[], Coroutine[Any, Any, dict]],
+                creating: Optional[str] = None) -> None:
+        """Schedules request, unless it creates the page of a post id
+        already being created"""
+        self._slots.acquire()
+        with self._lock:
+            if creating in self._creating:
+                logger.debug(f"{label} is already being saved")
+                self._slots.release()
+                return
+            future = self._loop.submit(self._save(request))
+            self._pending.add(future)
+            if creating:
+                self._creating.add(creating)
+        future.add_done_callback(
+            lambda x: self._on_done(label, creating, x))
+
+    async def _save(self,
+                    request: Callable[[], Coroutine[Any, Any, dict]]
+                    ) -> None:
+        page = await request()
+        await asyncio.to_thread(self._index.add_page, page)
+        logger.debug(f"Saved page {page['id']}")
+
+    async def _find_page(self, post_id: str) -> Optional[dict]:
+        """The page of post_id in the database, asked to notion"""
+        query = await self.policy.async_call(
+            lambda: self._async_client.databases.query(
+                self._db_id, **NotionSaveMeme._post_id_query(post_id)))
+        return next(iter(query['results']), None)
+
+    def _on_done(self, label: str, creating: Optional[str],
+                 future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+            if creating:
+                self._creating.discard(creating)
+            if (error := future.exception()):
+                logger.error(f"Unable to save {label} to notion: "
+                             f"{error!r}")
+                self._errors.append(error)
+        self._slots.release()
+
+
+class AsyncNotionGetMemes(_AsyncNotionBase, GetDBMemesRepo):
+    """Pages through the database like NotionGetMemes, but the next page is
+    requested as soon as the current one arrives, while its memes are
+    handled. The loop is stopped once the end is reached
+
+    Args:
+        client (Client): validates the database
+        async_client (AsyncClient): queries the database
+        database_id (str): the meme database
+        policy (NotionRetryPolicy): shared with the other notion repos
+    """
+
+    def __init__(self, client: Client, async_client: AsyncClient,
+                 database_id: str,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
+        _AsyncNotionBase.__init__(self, client, async_client, database_id,
+                                  policy, 1, 'notion-get')
+        self.at_end = False
+        self._filter: Optional[dict] = None
+        self._query: Optional[Future] = None
+        self._next_query: Optional[Future] = None
+        self._cursor: Optional[str] = None
+        self._next_cursor: Optional[str] = None
+        self._has_more = False
+        self._next_count = 0
+
+    def get_memes(self, filter: Optional[dict]) -> List[DBMeme]:
+        if self._query is None or filter != self._filter:
+            self._filter = filter
+            self._query = self._submit_query(self._cursor)
+
+        query = self._query.result()
+        self._next_cursor = query['next_cursor']
+        self._has_more = query['has_more']
+
+        if self._has_more and self._next_query is None:
+            self._next_query = self._submit_query(self._next_cursor)
+
+        return [NotionGetMemes.decode_page(x) for x in query['results']]
+
+    def next(self) -> int:
+        if not self._has_more:
+            self.at_end = True
+            self.close()
+            return self._next_count
+
+        self._cursor = self._next_cursor
+        self._query, self._next_query = self._next_query, None
+        self._next_count += 1
+        return self._next_count
+
+    def close(self) -> None:
+        if not self._loop.loop.is_closed():
+            self._close_loop()
+
+    def _submit_query(self, cursor: Optional[str]) -> Future:
+        kwargs: Dict[str, Any] = {}
+        if self._filter:
+            kwargs['filter'] = self._filter
+        if cursor:
+            kwargs['start_cursor'] = cursor
+
+        return self._loop.submit(self._request(
+            lambda: self._async_client.databases.query(self._db_id,
+                                                       **kwargs)))
@@ -1,6 +1,9 @@
 from enum import Enum
+from typing import Dict, Optional
 from notion_client import Client
 
+from .retry_policy import NotionRetryPolicy
+
 
 class Properties(Enum):
     EXTERNAL_REF = {"name": "9gag id", "type": "rich_text"}
@@ -9,15 +12,29 @@ class Properties(Enum):
 
 
 class NotionBase:
-    def __init__(self, client: Client, database_id: str) -> None:
+    def __init__(self, client: Client, database_id: str,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
         self._client = client
         self._db_id = database_id
+        self.policy = policy or NotionRetryPolicy()
+        self._property_ids: Dict[str, str] = {}
         self._validate_database_schema(database_id)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
     def _validate_database_schema(self, database_id: str) -> None:
-        db = self._client.databases.retrieve(database_id)
+        db = self.policy.call(
+            lambda: self._client.databases.retrieve(database_id))
         assert isinstance(db, dict)
 
+        self._property_ids = {
+            x['name']: x['id'] for x in db["properties"].values()
+        }
+
         def compare_dictionaries(dict1, dict2):
             for key, value in dict2.items():
                 if key not in dict1 or dict1[key] != value:
@@ -0,0 +1,47 @@
+import time
+import asyncio
+from threading import Lock
+from typing import Optional
+
+from ..download_policy import TokenBucket
+
+
+# notion allows an average of 3 requests per second per integration
+NOTION_RATE = 3
+
+
+class RequestBudget:
+    """The requests per second allowed to the notion repos sharing it, sync
+    or async, whatever the request. Waiting callers queue up in the order
+    they asked
+
+    Args:
+        rate (float): requests per second on average
+        burst (float): requests allowed at once, rate if not given
+    """
+
+    def __init__(self, rate: float = NOTION_RATE,
+                 burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self._lock = Lock()
+        self._bucket = TokenBucket(rate, burst or rate)
+
+    def wait(self) -> float:
+        """Blocks until a request may be sent, returns the seconds waited"""
+        delay = self._reserve()
+        time.sleep(delay)
+        return delay
+
+    async def async_wait(self) -> float:
+        delay = self._reserve()
+        await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds: float) -> None:
+        """No request may be sent for the next seconds"""
+        with self._lock:
+            self._bucket.pause(seconds, time.monotonic())
+
+    def _reserve(self) -> float:
+        with self._lock:
+            return self._bucket.reserve(time.monotonic())
@@ -6,14 +6,16 @@ from ninegag_notion_scraper.app.interfaces.meme_repo \
     import GetDBMemesRepo
 
 from .base import NotionBase
+from .retry_policy import NotionRetryPolicy
 from .converters import PageIDConverter, PostTitleConverter, PostIDConverter, \
     PostURLConverter, PostTagsConverter, PostCoverURLConverter, \
     TagsConverter, NoteConverter
 
 
 class NotionGetMemes(NotionBase, GetDBMemesRepo):
-    def __init__(self, client: Client, database_id: str) -> None:
-        NotionBase.__init__(self, client, database_id)
+    def __init__(self, client: Client, database_id: str,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
+        NotionBase.__init__(self, client, database_id, policy)
         self.at_end = False
         self._next_cursor = None
         self._current_cursor = None
@@ -21,48 +23,38 @@ class NotionGetMemes(NotionBase, GetDBMemesRepo):
         self._next_count = 0
 
     def get_memes(self, filter: Optional[dict]) -> List[DBMeme]:
+        kwargs: dict = {}
         if self._current_cursor:
-            if filter:
-                query = self._client.databases.query(
-                    self._db_id,
-                    start_cursor=self._current_cursor,
-                    filter=filter
-                )
-            else:
-                query = self._client.databases.query(
-                    self._db_id,
-                    start_cursor=self._current_cursor
-                )
+            kwargs['start_cursor'] = self._current_cursor
+        if filter:
+            kwargs['filter'] = filter
 
-        else:
-            if filter:
-                query = self._client.databases.query(self._db_id,
-                                                     filter=filter)
-            else:
-                query = self._client.databases.query(self._db_id)
+        query = self.policy.call(
+            lambda: self._client.databases.query(self._db_id, **kwargs))
 
         assert not isinstance(query, Awaitable)
         pages: list = query.get('results')
 
-        memes = []
-
-        for page in pages:
-            memes.append(DBMeme(
-                post_title=PostTitleConverter.decode(page),
-                post_id=PostIDConverter.decode(page),
-                post_url=PostURLConverter.decode(page),
-                post_tags=PostTagsConverter.decode(page),
-                post_cover_photo_url=PostCoverURLConverter.decode(page),
-                id=PageIDConverter.decode(page),
-                note=NoteConverter.decode(page),
-                tags=TagsConverter.decode(page)
-            ))
+        memes = [self.decode_page(page) for page in pages]
 
         self._next_cursor = query['next_cursor']
         self._has_more = query['has_more']
 
         return memes
 
+    @staticmethod
+    def decode_page(page: dict) -> DBMeme:
+        return DBMeme(
+            post_title=PostTitleConverter.decode(page),
+            post_id=PostIDConverter.decode(page),
+            post_url=PostURLConverter.decode(page),
+            post_tags=PostTagsConverter.decode(page),
+            post_cover_photo_url=PostCoverURLConverter.decode(page),
+            id=PageIDConverter.decode(page),
+            note=NoteConverter.decode(page),
+            tags=TagsConverter.decode(page)
+        )
+
     def next(self) -> int:
         if not self._has_more:
             self.at_end = True
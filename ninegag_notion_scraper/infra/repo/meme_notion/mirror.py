@@ -0,0 +1,319 @@
+import json
+import time
+import sqlite3
+import logging
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, \
+    Tuple
+from notion_client import Client
+
+from ninegag_notion_scraper.app.entities.meme import DBMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo import GetDBMemesRepo
+
+from .converters import NoteConverter, PageIDConverter, \
+    PostCoverURLConverter, PostIDConverter, PostTagsConverter, \
+    PostTitleConverter, PostURLConverter, TagsConverter
+from .retry_policy import NotionRetryPolicy
+
+
+logger = logging.getLogger("app.notion")
+
+PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id TEXT PRIMARY KEY,
+    post_id TEXT,
+    title TEXT,
+    url TEXT,
+    post_tags TEXT NOT NULL,
+    cover TEXT,
+    note TEXT,
+    tags TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_post_id ON pages (post_id);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# the properties of DBMeme a filter can refer to, by notion property name
+FILTER_PROPERTIES = {
+    'Name': 'post_title',
+    '9gag id': 'post_id',
+    'URL': 'post_url',
+    'Post Section': 'post_tags',
+    'Tags': 'tags',
+    'Note': 'note',
+}
+
+
+class NotionMirror:
+    """A copy of the meme database in SQLite, so the memes are read without
+    a request
+
+    sync() only fetches the pages edited since the last one, with a
+    last_edited_time filter. Notion leaves the deleted pages out of its
+    queries, so only a full sync removes them from the mirror
+
+    Args:
+        client (Client): notion client
+        database_id (str): the database mirrored
+        path (str): where the SQLite database is
+        policy (NotionRetryPolicy): sends the requests
+    """
+
+    def __init__(self, client: Client, database_id: str, path: str,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
+        self.path = path
+        self._client = client
+        self._db_id = database_id
+        self._policy = policy or NotionRetryPolicy()
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+        if self._get_state('database_id') not in (None, database_id):
+            logger.info("The mirror is of another database, emptying it")
+            self._clear()
+        self._set_state('database_id', database_id)
+
+    def sync(self, full: bool = False) -> int:
+        """Fetches the pages edited since the last sync, or every page if
+        full or never synced, and returns how many were fetched"""
+        start = time.perf_counter()
+        started_at = time.time()
+        since = None if full else self._get_state('last_edited_time')
+        count = 0
+
+        for page in self._iter_pages(since):
+            self.add_page(page, started_at)
+            count += 1
+            if count % PAGE_SIZE == 0:
+                # the pages come in edit order, an interrupted sync resumes
+                # from the last one saved
+                self._set_state('last_edited_time', page['last_edited_time'])
+                logger.debug(f"Synced {count} pages")
+
+        # the pages saved by add_page since the last sync don't move it
+        # forward, the pages edited by others meanwhile would be skipped
+        if count:
+            self._set_state('last_edited_time', page['last_edited_time'])
+
+        if full or since is None:
+            with self._lock:
+                deleted = self._connection.execute(
+                    "DELETE FROM pages WHERE synced_at < ?",
+                    (started_at,)).rowcount
+            if deleted:
+                logger.info(f"Removed {deleted} deleted pages from the "
+                            "mirror")
+
+        logger.info(f"Synced {count} pages from notion "
+                    f"{'since ' + since if since else 'in full'} in "
+                    f"{time.perf_counter() - start:.1f}s, {len(self)} in "
+                    "the mirror")
+        return count
+
+    def add_page(self, page: dict, synced_at: Optional[float] = None
+                 ) -> None:
+        """Saves a page object returned by the notion API"""
+        row = (
+            PageIDConverter.decode(page),
+            _decode(PostIDConverter.decode, page),
+            _decode(PostTitleConverter.decode, page),
+            _decode(PostURLConverter.decode, page),
+            json.dumps(_decode(PostTagsConverter.decode, page) or []),
+            _decode(PostCoverURLConverter.decode, page),
+            _decode(NoteConverter.decode, page),
+            json.dumps(_decode(TagsConverter.decode, page) or []),
+            page['last_edited_time'],
+            synced_at or time.time(),
+        )
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def page_id(self, post_id: str) -> Optional[str]:
+        """The page id of post_id, None if it has no page"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id FROM pages WHERE post_id = ? LIMIT 1",
+                (post_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, post_id: str) -> Optional[DBMeme]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM pages WHERE post_id = ? LIMIT 1",
+                (post_id,)).fetchone()
+        return _to_meme(row) if row else None
+
+    def memes(self, after: Optional[str] = None, limit: int = PAGE_SIZE
+              ) -> Tuple[List[DBMeme], Optional[str]]:
+        """Up to limit memes, in page id order, following the page id
+        after, and the page id to continue from, None at the end. Pages
+        missing a property of DBMeme are left out"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM pages WHERE id > ? ORDER BY id LIMIT ?",
+                (after or '', limit)).fetchall()
+        memes = [_to_meme(x) for x in rows]
+        return [x for x in memes if x is not None], \
+            rows[-1][0] if len(rows) == limit else None
+
+    def __contains__(self, post_id: str) -> bool:
+        return self.page_id(post_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def _iter_pages(self, since: Optional[str]) -> Iterator[dict]:
+        cursor: Optional[str] = None
+
+        while True:
+            query = self._query(since, cursor)
+            yield from query['results']
+            if not query['has_more']:
+                return
+            cursor = query['next_cursor']
+
+    def _query(self, since: Optional[str], cursor: Optional[str]) -> dict:
+        kwargs: Dict[str, Any] = {
+            'page_size': PAGE_SIZE,
+            'sorts': [{'timestamp': 'last_edited_time',
+                       'direction': 'ascending'}],
+        }
+        if since:
+            kwargs['filter'] = {'timestamp': 'last_edited_time',
+                                'last_edited_time': {'on_or_after': since}}
+        if cursor:
+            kwargs['start_cursor'] = cursor
+
+        query = self._policy.call(
+            lambda: self._client.databases.query(self._db_id, **kwargs))
+        assert not isinstance(query, Awaitable)
+        return query
+
+    def _get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?)", (key, value))
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM pages")
+            self._connection.execute("DELETE FROM state")
+
+
+class NotionMirrorGetMemes(GetDBMemesRepo):
+    """Pages through the memes of a NotionMirror like NotionGetMemes does
+    through the database. Filters are evaluated locally, see match_filter
+    """
+
+    def __init__(self, mirror: NotionMirror,
+                 page_size: int = PAGE_SIZE) -> None:
+        self.at_end = False
+        self._mirror = mirror
+        self._page_size = page_size
+        self._after: Optional[str] = None
+        self._next_after: Optional[str] = None
+        self._next_count = 0
+
+    def get_memes(self, filter: Optional[dict]) -> List[DBMeme]:
+        memes, self._next_after = self._mirror.memes(self._after,
+                                                     self._page_size)
+        if filter:
+            memes = [x for x in memes if match_filter(x, filter)]
+        return memes
+
+    def next(self) -> int:
+        if self._next_after is None:
+            self.at_end = True
+            return self._next_count
+
+        self._after = self._next_after
+        self._next_count += 1
+        return self._next_count
+
+
+def match_filter(meme: DBMeme, filter: dict) -> bool:
+    """Whether meme passes a notion database filter. Supports 'and', 'or'
+    and the text, url and multi_select conditions on FILTER_PROPERTIES"""
+    if 'and' in filter:
+        return all(match_filter(meme, x) for x in filter['and'])
+    if 'or' in filter:
+        return any(match_filter(meme, x) for x in filter['or'])
+
+    if filter.get('property') not in FILTER_PROPERTIES:
+        raise ValueError(f"Filter not supported by the mirror: {filter}")
+    value = getattr(meme, FILTER_PROPERTIES[filter['property']])
+
+    for kind in ('multi_select', 'rich_text', 'title', 'url'):
+        if kind not in filter:
+            continue
+        (operator, operand), = filter[kind].items()
+        if operator == 'is_empty':
+            return not value
+        if operator == 'is_not_empty':
+            return bool(value)
+        if operator == 'equals':
+            return value == operand
+        if operator == 'does_not_equal':
+            return value != operand
+        if operator == 'contains':
+            return operand in (value or '')
+        if operator == 'does_not_contain':
+            return operand not in (value or '')
+
+    raise ValueError(f"Filter not supported by the mirror: {filter}")
+
+
+def _decode(decode: Callable[[dict], Any], page: dict) -> Any:
+    try:
+        return decode(page)
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _to_meme(row: tuple) -> Optional[DBMeme]:
+    (page_id, post_id, title, url, post_tags, cover, note, tags,
+     _, _) = row
+    if None in (post_id, title, url, cover):
+        logger.debug(f"Page {page_id} is missing properties, skipping it")
+        return None
+    return DBMeme(
+        post_title=title,
+        post_id=post_id,
+        post_url=url,
+        post_tags=json.loads(post_tags),
+        post_cover_photo_url=cover,
+        id=page_id,
+        note=note,
+        tags=json.loads(tags)
+    )
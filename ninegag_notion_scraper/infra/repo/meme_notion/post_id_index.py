@@ -0,0 +1,101 @@
+import time
+import logging
+from threading import Lock
+from typing import Awaitable, Dict, Iterator, Optional
+from notion_client import Client
+
+from .converters import PageIDConverter, PostIDConverter
+from .retry_policy import NotionRetryPolicy
+
+
+logger = logging.getLogger("app.notion")
+
+PAGE_SIZE = 100
+
+
+class NotionPostIDIndex:
+    """The page id of every post id of the database, loaded once by paging
+    through the database with only the post id property, then kept up to
+    date by add_page(). Existence checks cost no request after the load
+
+    Args:
+        client (Client): notion client
+        database_id (str): the database indexed
+        property_id (str): id of the post id property, the only one
+            returned by the load
+        policy (NotionRetryPolicy): sends the requests
+    """
+
+    def __init__(self, client: Client, database_id: str,
+                 property_id: Optional[str] = None,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
+        self._client = client
+        self._db_id = database_id
+        self._property_id = property_id
+        self._policy = policy or NotionRetryPolicy()
+        self._lock = Lock()
+        self._pages: Optional[Dict[str, str]] = None
+
+    def page_id(self, post_id: str) -> Optional[str]:
+        """The page id of post_id, None if it has no page"""
+        return self._get_pages().get(post_id)
+
+    def add_page(self, page: dict) -> None:
+        """Indexes a page object returned by the notion API"""
+        with self._lock:
+            if self._pages is not None:
+                self._pages[PostIDConverter.decode(page)] = \
+                    PageIDConverter.decode(page)
+
+    def __contains__(self, post_id: str) -> bool:
+        return post_id in self._get_pages()
+
+    def __len__(self) -> int:
+        return len(self._get_pages())
+
+    def _get_pages(self) -> Dict[str, str]:
+        with self._lock:
+            if self._pages is None:
+                self._pages = self._load()
+            return self._pages
+
+    def _load(self) -> Dict[str, str]:
+        start = time.perf_counter()
+        pages: Dict[str, str] = {}
+
+        for page in self._iter_pages():
+            try:
+                post_id = PostIDConverter.decode(page)
+            except (KeyError, IndexError):
+                logger.warning(f"Page {page['id']} has no post id")
+                continue
+            if post_id in pages:
+                logger.warning(f"More then 1 item has the id of {post_id}")
+                continue
+            pages[post_id] = PageIDConverter.decode(page)
+
+        logger.info(f"Loaded {len(pages)} post ids from notion in "
+                    f"{time.perf_counter() - start:.1f}s")
+        return pages
+
+    def _iter_pages(self) -> Iterator[dict]:
+        cursor: Optional[str] = None
+
+        while True:
+            query = self._query(cursor)
+            yield from query['results']
+            if not query['has_more']:
+                return
+            cursor = query['next_cursor']
+
+    def _query(self, cursor: Optional[str]) -> dict:
+        kwargs: Dict[str, object] = {'page_size': PAGE_SIZE}
+        if cursor:
+            kwargs['start_cursor'] = cursor
+        if self._property_id:
+            kwargs['filter_properties'] = [self._property_id]
+
+        query = self._policy.call(
+            lambda: self._client.databases.query(self._db_id, **kwargs))
+        assert not isinstance(query, Awaitable)
+        return query
@@ -0,0 +1,199 @@
+import time
+import random
+import asyncio
+import logging
+import itertools
+from collections import defaultdict
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import httpx
+from notion_client import APIErrorCode, APIResponseError
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from ..download_policy import DownloadPolicy
+from .budget import RequestBudget
+
+
+logger = logging.getLogger("app.notion")
+
+T = TypeVar('T')
+
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+# transient, but the request may have gone through
+AMBIGUOUS = 'ambiguous'
+
+TRANSIENT_CODES = {APIErrorCode.InternalServerError,
+                   APIErrorCode.ServiceUnavailable,
+                   APIErrorCode.ConflictError}
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+# notion answered without applying the request
+UNAPPLIED_CODES = {APIErrorCode.ServiceUnavailable,
+                   APIErrorCode.ConflictError}
+UNAPPLIED_STATUSES = {409, 503}
+
+
+class NotionRetryPolicy:
+    """How every notion request is sent and retried
+
+    Errors are split in three:
+        rate_limited: retried after their Retry-After, which also pauses
+            budget for every other request
+        transient: 5xx, conflicts, timeouts and connection errors, retried
+            after a short full jitter exponential backoff
+        permanent: the others (validation, permissions, not found...),
+            raised right away
+
+    A request that isn't idempotent, like a page creation, is only retried
+    right away after a rate limit, a conflict or a 503, which notion didn't
+    apply. The other transient errors, a 500, a gateway error or a timeout,
+    may come after the page was created: they are raised, unless verify
+    is given, which is called to look for what the request would have
+    returned. Its result is returned when found, else the request is
+    retried. The counters are logged by close()
+
+    Args:
+        retries (int): retries of a request before giving up
+        backoff (float): seconds of the first transient backoff
+        max_backoff (float): longest wait between two retries
+        budget (RequestBudget): waited on before each try
+    """
+
+    def __init__(self,
+                 retries: int = 5,
+                 backoff: float = 1,
+                 max_backoff: float = 30,
+                 budget: Optional[RequestBudget] = None) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self._lock = Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+
+    def call(self, func: Callable[[], T], idempotent: bool = True,
+             verify: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """Calls func, which sends one notion request, within the policy"""
+        for attempt in itertools.count():
+            if self.budget:
+                self._count('budget_wait_seconds', self.budget.wait())
+            self._count('requests')
+            try:
+                result = func()
+            except Exception as error:
+                kind = self.classify(error, idempotent)
+                if kind == AMBIGUOUS and verify is not None:
+                    self._count('verifications')
+                    if (found := verify()) is not None:
+                        self._count('verified')
+                        return found
+                    kind = TRANSIENT
+                if (delay := self._on_error(attempt, error, kind)) is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._count('successes')
+            return result
+        raise AssertionError("unreachable")
+
+    async def async_call(
+            self, func: Callable[[], Awaitable[T]],
+            idempotent: bool = True,
+            verify: Optional[Callable[[], Awaitable[Optional[T]]]] = None
+    ) -> T:
+        """Same as call, for coroutines"""
+        for attempt in itertools.count():
+            if self.budget:
+                self._count('budget_wait_seconds',
+                            await self.budget.async_wait())
+            self._count('requests')
+            try:
+                result = await func()
+            except Exception as error:
+                kind = self.classify(error, idempotent)
+                if kind == AMBIGUOUS and verify is not None:
+                    self._count('verifications')
+                    if (found := await verify()) is not None:
+                        self._count('verified')
+                        return found
+                    kind = TRANSIENT
+                if (delay := self._on_error(attempt, error, kind)) is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._count('successes')
+            return result
+        raise AssertionError("unreachable")
+
+    @property
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def close(self) -> None:
+        if counters := self.counters:
+            logger.info("Notion requests: " + ", ".join(
+                f"{key} {value:g}" for key, value in sorted(counters.items())
+            ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    @staticmethod
+    def classify(error: BaseException, idempotent: bool = True) -> str:
+        if isinstance(error, APIResponseError) and \
+                error.code == APIErrorCode.RateLimited:
+            return RATE_LIMITED
+        if isinstance(error, HTTPResponseError):
+            code = getattr(error, 'code', None)
+            if error.status == 429:
+                return RATE_LIMITED
+            if not idempotent and (error.status in UNAPPLIED_STATUSES or
+                                   code in UNAPPLIED_CODES):
+                return TRANSIENT
+            if error.status in TRANSIENT_STATUSES or \
+                    code in TRANSIENT_CODES:
+                return TRANSIENT if idempotent else AMBIGUOUS
+            return PERMANENT
+        if isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+            return TRANSIENT if idempotent else AMBIGUOUS
+        return PERMANENT
+
+    def _on_error(self, attempt: int, error: BaseException,
+                  kind: str) -> Optional[float]:
+        """Records the failure, returns the seconds to wait before the next
+        try or None if the error has to be raised"""
+        self._count(f'{kind}_errors')
+        if kind in (PERMANENT, AMBIGUOUS):
+            return None
+        if attempt >= self.retries:
+            self._count('given_up')
+            return None
+
+        retry_after = None
+        if kind == RATE_LIMITED and isinstance(error, HTTPResponseError):
+            retry_after = DownloadPolicy._parse_retry_after(
+                error.headers.get('Retry-After'))
+            if retry_after is not None and self.budget:
+                self.budget.pause(retry_after)
+
+        backoff = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if retry_after is not None:
+            delay = retry_after
+        elif kind == RATE_LIMITED:
+            delay = backoff
+        else:
+            delay = random.uniform(0, backoff)
+        self._count('retries')
+        self._count('retry_seconds', delay)
+        logger.info(f"Retrying the notion request in {delay:.1f}s: "
+                    f"{error!r}")
+        return delay
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[key] += value
@@ -2,8 +2,7 @@
 
 import logging
 from typing import Awaitable, Optional
-from notion_client import Client, APIResponseError
-from retry import retry
+from notion_client import Client
 
 from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
 from ninegag_notion_scraper.app.interfaces.meme_repo \
@@ -12,14 +11,29 @@ from ninegag_notion_scraper.app.interfaces.meme_repo \
 from .base import Properties, NotionBase
 from .converters import PostIDConverter, PostTitleConverter, \
     PostURLConverter, PostTagsConverter, PostCoverURLConverter, TagsConverter
+from .mirror import NotionMirror
+from .post_id_index import NotionPostIDIndex
+from .retry_policy import NotionRetryPolicy
 
 
 logger = logging.getLogger("app.notion")
 
 
 class NotionSaveMeme(NotionBase, SaveMemeRepo, UpdateMemeRepo):
-    def __init__(self, client: Client, database_id: str) -> None:
-        NotionBase.__init__(self, client, database_id)
+    """Saves the memes as pages of a database. Whether a meme has a page
+    is answered by mirror, else by a NotionPostIDIndex loaded on the first
+    check. Both are updated with the pages created and updated. Every
+    request goes through policy"""
+
+    def __init__(self, client: Client, database_id: str,
+                 mirror: Optional[NotionMirror] = None,
+                 policy: Optional[NotionRetryPolicy] = None) -> None:
+        NotionBase.__init__(self, client, database_id, policy)
+        self._index: NotionMirror | NotionPostIDIndex = \
+            mirror or NotionPostIDIndex(
+                client, database_id,
+                self._property_ids.get(Properties.EXTERNAL_REF.value['name']),
+                policy=self.policy)
 
     def save_meme(self,
                   meme: PostMeme,
@@ -31,77 +45,73 @@ class NotionSaveMeme(NotionBase, SaveMemeRepo, UpdateMemeRepo):
         tags = meme.post_tags
         cover_url = meme.post_cover_photo_url
 
-        if not (existing_page := self._exists(item_id)):
-            self._create_page(title, item_id, external_web_url,
-                              tags, cover_url)
+        if not (page_id := self._index.page_id(item_id)):
+            self._index.add_page(self._create_page(
+                title, item_id, external_web_url, tags, cover_url))
             logger.debug("Created page for Post ID of %s", item_id)
 
-        elif existing_page and update:
-            self._update_page(existing_page['id'], title, item_id,
-                              external_web_url, tags, cover_url)
+        elif update:
+            self._index.add_page(self._update_page(
+                page_id, title, item_id, external_web_url, tags, cover_url))
             logger.debug("Updated page for Post ID of %s", item_id)
 
     def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
-        return all([self._exists(meme.post_id)])
+        exists = meme.post_id in self._index
+        logger.debug("ID %s %s", meme.post_id,
+                     "already exists" if exists else "doesn't exists")
+        return exists
 
     def update_meme(self, id: str, tags: list) -> None:
-        self._client.pages.update(
+        page = self.policy.call(lambda: self._client.pages.update(
             page_id=id,
             properties={
                 **TagsConverter.encode(tags)
             }
-        )
-
-    @retry(exceptions=APIResponseError, tries=5, delay=30, backoff=2)
-    def _exists(self, post_id: str) -> Optional[dict]:
-        """Checks if item with post_id exists and return if it does
-
-        Args:
-            post_id (str): post_id on notion
-
-        Raises:
-            ValueError: More than 1 item with the same id was found
-
-        Returns:
-            Optional[dict]: page information from notion
-        """
-        query = self._client.databases.query(
-            database_id=self._db_id,
-            filter={
-                "property": Properties.EXTERNAL_REF.value['name'],
-                "rich_text": {
-                    "equals": post_id
-                }
-            })
-
-        assert not isinstance(query, Awaitable)
-        results: list = query.get('results')
-
-        if len(results) > 1:
-            raise ValueError(f"More then 1 item has the id of {post_id}")
-        if len(results) == 1:
-            logger.debug("ID %s already exists", post_id)
-            return results[0]
-        logger.debug("ID %s doesn't exists", post_id)
-        return None
+        ))
+        assert not isinstance(page, Awaitable)
+        self._index.add_page(page)
 
     def _update_page(self, page_id, name, post_id, url, post_section,
-                     cover_photo):
-        self._client.pages.update(
+                     cover_photo) -> dict:
+        page = self.policy.call(lambda: self._client.pages.update(
             page_id=page_id,
-            cover=PostCoverURLConverter.encode(cover_photo),
-            properties={
-                **PostTitleConverter.encode(name),
-                **PostURLConverter.encode(url),
-                **PostIDConverter.encode(post_id),
-                **PostTagsConverter.encode(post_section)
-            }
+            **self._page_content(name, post_id, url, post_section,
+                                 cover_photo)
+        ))
+        assert not isinstance(page, Awaitable)
+        return page
+
+    def _create_page(self, name, post_id, url, post_section,
+                     cover_photo) -> dict:
+        page = self.policy.call(lambda: self._client.pages.create(
+            parent={"database_id": self._db_id},
+            **self._page_content(name, post_id, url, post_section,
+                                 cover_photo)
+        ), idempotent=False, verify=lambda: self._find_page(post_id))
+        assert not isinstance(page, Awaitable)
+        return page
+
+    def _find_page(self, post_id: str) -> Optional[dict]:
+        """The page of post_id in the database, asked to notion"""
+        query = self.policy.call(lambda: self._client.databases.query(
+            self._db_id, **self._post_id_query(post_id)))
+        assert not isinstance(query, Awaitable)
+        return next(iter(query['results']), None)
+
+    @staticmethod
+    def _post_id_query(post_id: str) -> dict:
+        return dict(
+            filter={
+                'property': Properties.EXTERNAL_REF.value['name'],
+                'rich_text': {'equals': post_id}
+            },
+            page_size=1
         )
 
-    @retry(exceptions=APIResponseError, tries=5, delay=30, backoff=2)
-    def _create_page(self, name, post_id, url, post_section, cover_photo):
-        self._client.pages.create(
-            parent={"database_id": self._db_id},
+    @staticmethod
+    def _page_content(name, post_id, url, post_section,
+                      cover_photo) -> dict:
+        return dict(
             cover=PostCoverURLConverter.encode(cover_photo),
             properties={
                 **PostTitleConverter.encode(name),
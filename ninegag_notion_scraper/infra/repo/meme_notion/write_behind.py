@@ -0,0 +1,250 @@
+import time
+import sqlite3
+import logging
+from queue import Queue
+from threading import Condition, Event, Lock, Thread
+from typing import List, Optional, Set
+
+from ninegag_notion_scraper.app.entities.meme import DBMeme, PostMeme
+from ninegag_notion_scraper.app.interfaces.meme_repo \
+    import SaveMemeRepo, UpdateMemeRepo
+
+from .retry_policy import PERMANENT, NotionRetryPolicy
+from .save_meme import NotionSaveMeme
+
+
+logger = logging.getLogger("app.notion")
+
+# a create takes about as long as the budget of 3 requests per second
+# allows between two, a few at once keep the budget busy
+WORKERS = 3
+# runs failing to save a meme before it is moved to the failed table
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    post_id TEXT PRIMARY KEY,
+    meme TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS failed (
+    post_id TEXT PRIMARY KEY,
+    meme TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class NotionWriteBehind(SaveMemeRepo, UpdateMemeRepo):
+    """Saves the memes through repo in the background: save_meme journals
+    the meme and returns, workers create the pages as fast as the policy of
+    repo allows and remove them from the journal once created
+
+    The journal is a SQLite database, the memes left in it by a crash or an
+    interrupted run are saved first by the next one. A meme whose page was
+    created right before a crash is found by repo and isn't created twice.
+    The journaled memes count as existing. Updates aren't buffered, they
+    wait for the journaled memes to be saved, leaving their errors to
+    flush()
+
+    A failed save is logged and its meme stays in the journal for the next
+    run. After max_attempts failed runs, or a permanent error, the meme is
+    moved to the 'failed' table of the journal instead, which is left for
+    a person to look at. The first error is raised by flush() or close()
+
+    Args:
+        repo (NotionSaveMeme): creates the pages
+        journal_path (str): where the SQLite journal is
+        workers (int): pages created at once
+        max_attempts (int): failed saves of a meme before it is moved to
+            the failed table
+    """
+
+    def __init__(self, repo: NotionSaveMeme, journal_path: str,
+                 workers: int = WORKERS,
+                 max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.repo = repo
+        self.path = journal_path
+        self.max_attempts = max_attempts
+        self._lock = Lock()
+        self._saved = Condition(self._lock)
+        self._stop = Event()
+        self._queue: Queue[Optional[str]] = Queue()
+        self._pending: Set[str] = set()
+        self._errors: List[BaseException] = []
+        self._connection = sqlite3.connect(journal_path,
+                                           check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # every meme is synced to disk before save_meme returns
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(SCHEMA)
+
+        failed, = self._connection.execute(
+            "SELECT COUNT(*) FROM failed").fetchone()
+        if failed:
+            logger.warning(f"{failed} memes could not be saved to notion, "
+                           f"see the failed table of {journal_path}")
+
+        rows = self._connection.execute(
+            "SELECT post_id FROM pending ORDER BY queued_at").fetchall()
+        if rows:
+            logger.info(f"Resuming {len(rows)} notion saves from the "
+                        "journal")
+        for post_id, in rows:
+            self._pending.add(post_id)
+            self._queue.put(post_id)
+
+        self._threads = [
+            Thread(target=self._work, name=f"notion-write-{x}", daemon=True)
+            for x in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def save_meme(self,
+                  meme: PostMeme,
+                  update: bool = False
+                  ) -> None:
+        if update:
+            self._wait_pending()
+            self.repo.save_meme(meme, update=True)
+            return
+
+        with self._lock:
+            if meme.post_id in self._pending:
+                return
+            # a meme already failing keeps its attempts
+            self._connection.execute(
+                "INSERT INTO pending (post_id, meme, queued_at) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT (post_id) DO UPDATE SET meme = excluded.meme",
+                (meme.post_id, meme.model_dump_json(), time.time()))
+            self._pending.add(meme.post_id)
+        self._queue.put(meme.post_id)
+
+    def meme_exists(self, meme: PostMeme | DBMeme) -> bool:
+        """Whether the meme has a page or is journaled"""
+        with self._lock:
+            if meme.post_id in self._pending:
+                return True
+        return self.repo.meme_exists(meme)
+
+    def update_meme(self, id: str, tags: list) -> None:
+        self.repo.update_meme(id, tags)
+
+    def flush(self) -> None:
+        """Waits for every journaled meme and raises the first error"""
+        self._wait_pending()
+        with self._lock:
+            errors, self._errors = self._errors, []
+
+        if errors:
+            if len(errors) > 1:
+                logger.error(f"{len(errors)} notion saves failed")
+            raise errors[0]
+
+    def close(self, flush: bool = True) -> None:
+        """Stops the workers, after saving every journaled meme if flush,
+        else after their current save"""
+        try:
+            if flush:
+                self.flush()
+        finally:
+            self._stop.set()
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+            with self._lock:
+                left = self._connection.execute(
+                    "SELECT COUNT(*) FROM pending").fetchone()[0]
+                self._connection.close()
+            if left:
+                logger.info(f"{left} notion saves left in the journal for "
+                            "the next run")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        # the journal keeps what an interrupted run didn't save
+        self.close(flush=exception_type is None)
+
+    def _wait_pending(self) -> None:
+        with self._lock:
+            while self._pending:
+                self._saved.wait()
+
+    def _work(self) -> None:
+        while (post_id := self._queue.get()) is not None and \
+                not self._stop.is_set():
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT meme FROM pending WHERE post_id = ?",
+                    (post_id,)).fetchone()
+
+            try:
+                if row:
+                    self.repo.save_meme(PostMeme.model_validate_json(row[0]))
+            except Exception as error:
+                with self._lock:
+                    self._errors.append(error)
+                    try:
+                        self._on_error(post_id, error)
+                    except sqlite3.Error as journal_error:
+                        logger.error(f"Unable to record the failed save of "
+                                     f"Meme ID {post_id} in the journal: "
+                                     f"{journal_error!r}")
+                    finally:
+                        # flush() waits for the id whatever happens
+                        self._pending.discard(post_id)
+                        self._saved.notify_all()
+                continue
+
+            with self._lock:
+                try:
+                    self._connection.execute(
+                        "DELETE FROM pending WHERE post_id = ?", (post_id,))
+                finally:
+                    self._pending.discard(post_id)
+                    self._saved.notify_all()
+
+    def _on_error(self, post_id: str, error: Exception) -> None:
+        """Counts the failed attempt, and moves the meme to the failed
+        table once it has no chance to be saved. Called with the lock"""
+        row = self._connection.execute(
+            "UPDATE pending SET attempts = attempts + 1 WHERE post_id = ? "
+            "RETURNING attempts", (post_id,)).fetchone()
+        if row is None:
+            logger.error(f"Unable to save Meme ID {post_id} to notion: "
+                         f"{error!r}")
+            return
+        attempts, = row
+
+        if NotionRetryPolicy.classify(error) != PERMANENT and \
+                attempts < self.max_attempts:
+            logger.error(f"Unable to save Meme ID {post_id} to notion, it "
+                         f"stays in the journal ({attempts} attempts): "
+                         f"{error!r}")
+            return
+
+        self._connection.execute("BEGIN")
+        try:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO failed "
+                "SELECT post_id, meme, attempts, ?, ? FROM pending "
+                "WHERE post_id = ?", (repr(error), time.time(), post_id))
+            self._connection.execute(
+                "DELETE FROM pending WHERE post_id = ?", (post_id,))
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        logger.error(f"Unable to save Meme ID {post_id} to notion after "
+                     f"{attempts} attempts, moved it to the failed table of "
+                     f"the journal: {error!r}")
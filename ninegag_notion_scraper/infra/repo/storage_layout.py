@@ -0,0 +1,64 @@
+import os
+import hashlib
+from typing import Iterator, List
+
+
+class StorageLayout:
+    """Where the files of a post go under a storage directory
+
+    With levels at 0 every file is directly in the storage directory. Else
+    the files are spread over levels of nested directories named after the
+    first characters of the md5 of the post id, ex: 'ab/cd/<post_id>.mp4'
+    with 2 levels of width 2, so that no directory gets too large
+
+    Args:
+        levels (int): number of nested directories
+        width (int): number of hex characters naming each directory
+    """
+
+    def __init__(self, levels: int = 0, width: int = 2) -> None:
+        self.levels = levels
+        self.width = width
+
+    @property
+    def is_flat(self) -> bool:
+        return self.levels == 0
+
+    def directory(self, root: str, post_id: str) -> str:
+        """The directory of the files of post_id"""
+        if self.is_flat:
+            return root
+        digest = hashlib.md5(post_id.encode()).hexdigest()
+        parts = [digest[x * self.width:(x + 1) * self.width]
+                 for x in range(self.levels)]
+        return os.path.join(root, *parts)
+
+    def directories(self, root: str) -> Iterator[str]:
+        """The existing directories holding files under root"""
+        yield from self._directories(root, self.levels)
+
+    def _directories(self, path: str, levels: int) -> Iterator[str]:
+        if levels == 0:
+            yield path
+            return
+        for sub_directory in self._sub_directories(path):
+            yield from self._directories(sub_directory, levels - 1)
+
+    def mtime_ns(self, root: str) -> int:
+        """The latest mtime of the directories of root, it changes whenever
+        a file is added to or removed from root"""
+        return self._mtime_ns(root, self.levels)
+
+    def _mtime_ns(self, path: str, levels: int) -> int:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if levels == 0:
+            return mtime_ns
+        return max([mtime_ns] + [
+            self._mtime_ns(sub_directory, levels - 1)
+            for sub_directory in self._sub_directories(path)
+        ])
+
+    @staticmethod
+    def _sub_directories(path: str) -> List[str]:
+        with os.scandir(path) as entries:
+            return [x.path for x in entries if x.is_dir()]
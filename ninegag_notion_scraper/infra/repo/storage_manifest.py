@@ -0,0 +1,99 @@
+import os
+import time
+import sqlite3
+from dataclasses import dataclass
+from threading import Lock
+from typing import Iterator, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT,
+    content_type TEXT,
+    url TEXT,
+    saved_at REAL NOT NULL,
+    PRIMARY KEY (root, post_id)
+)
+"""
+
+
+@dataclass
+class ManifestEntry:
+    root: str
+    post_id: str
+    extension: str
+    size: int
+    mtime_ns: int
+    sha256: Optional[str]
+    content_type: Optional[str]
+    url: Optional[str]
+    saved_at: float
+
+
+class StorageManifest:
+    """What was saved in each storage directory, in SQLite: the size,
+    mtime, sha256, content type and source url of every file
+
+    Files are keyed by their storage directory and post id rather than by
+    their path, so the manifest stays valid when the layout changes. The
+    connection is shared by the download threads behind a lock"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+
+    def record(self, root: str, post_id: str, file_path: str,
+               url: Optional[str] = None, sha256: Optional[str] = None,
+               content_type: Optional[str] = None) -> None:
+        """Records the file of post_id saved at file_path, under root"""
+        file_stat = os.stat(file_path)
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(root), post_id,
+                 os.path.splitext(file_path)[1], file_stat.st_size,
+                 file_stat.st_mtime_ns, sha256, content_type, url,
+                 time.time()))
+
+    def update_stat(self, entry: ManifestEntry, size: int,
+                    mtime_ns: int) -> None:
+        """Records the new size and mtime of a file found intact"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE files SET size = ?, mtime_ns = ? "
+                "WHERE root = ? AND post_id = ?",
+                (size, mtime_ns, entry.root, entry.post_id))
+
+    def entries(self, root: Optional[str] = None
+                ) -> Iterator[ManifestEntry]:
+        with self._lock:
+            if root is None:
+                cursor = self._connection.execute("SELECT * FROM files")
+            else:
+                cursor = self._connection.execute(
+                    "SELECT * FROM files WHERE root = ?",
+                    (os.path.abspath(root),))
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield ManifestEntry(*row)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
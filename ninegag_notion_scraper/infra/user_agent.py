@@ -0,0 +1,94 @@
+"""User agents cached on disk, refreshed in the background"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import List, Optional
+
+
+logger = logging.getLogger('app.useragent')
+
+USER_AGENTS_CACHE = "user_agents.json"
+USER_AGENTS_TTL = 7 * 24 * 60 * 60
+
+DEFAULT_USER_AGENT = \
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) ' \
+    'AppleWebKit/537.36 (KHTML, like Gecko) ' \
+    'Chrome/120.0.0.0 Safari/537.36'
+
+_refresh_lock = threading.Lock()
+
+
+def get_user_agent(index: int = 1) -> str:
+    """Returns a recent user agent without ever waiting on the network.
+
+    The list comes from the on disk cache, which is refreshed in a
+    background thread once older than USER_AGENTS_TTL. Falls back to
+    DEFAULT_USER_AGENT while nothing is cached"""
+    cache = _read_cache()
+
+    if cache is None or time.time() - cache['fetched_at'] > USER_AGENTS_TTL:
+        refresh_user_agents_in_background()
+
+    if cache and cache['user_agents']:
+        user_agents = cache['user_agents']
+        return user_agents[min(index, len(user_agents) - 1)]
+
+    logger.debug("No cached user agents, using the default one")
+    return DEFAULT_USER_AGENT
+
+
+def refresh_user_agents_in_background() -> Optional[threading.Thread]:
+    """Starts refreshing the cache unless a refresh is already running"""
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+
+    thread = threading.Thread(target=_refresh, name="user-agents",
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def _refresh() -> None:
+    try:
+        from latest_user_agents import get_latest_user_agents
+
+        _write_cache(get_latest_user_agents())
+        logger.debug("User agents cache refreshed")
+    except Exception as error:
+        logger.warning(f"Unable to refresh the user agents: {error!r}")
+    finally:
+        _refresh_lock.release()
+
+
+def _read_cache() -> Optional[dict]:
+    if not os.path.exists(USER_AGENTS_CACHE):
+        return None
+
+    try:
+        with open(USER_AGENTS_CACHE, "r") as file:
+            cache = json.load(file)
+    except (OSError, ValueError) as error:
+        logger.warning(f"Ignoring unreadable user agents cache: {error!r}")
+        return None
+
+    if not isinstance(cache, dict) or \
+            not isinstance(cache.get('fetched_at'), (int, float)) or \
+            not isinstance(cache.get('user_agents'), list) or \
+            not all(isinstance(x, str) for x in cache['user_agents']):
+        logger.warning("Ignoring user agents cache of an unknown format")
+        return None
+
+    return cache
+
+
+def _write_cache(user_agents: List[str]) -> None:
+    temp_path = f"{USER_AGENTS_CACHE}.{os.getpid()}.tmp"
+
+    with open(temp_path, "w") as file:
+        json.dump({'fetched_at': time.time(),
+                   'user_agents': list(user_agents)}, file)
+
+    os.replace(temp_path, USER_AGENTS_CACHE)
@@ -1,5 +1,13 @@
 from selenium import webdriver
-from latest_user_agents import get_latest_user_agents
+from .user_agent import get_user_agent
+
+
+# Everything the scraper never needs to render, only to read urls from
+BLOCKED_URL_PATTERNS = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif',
+    '*.mp4', '*.webm', '*.m3u8',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+]
 
 
 def get_webdriver_chrome() -> webdriver.Chrome:
@@ -9,7 +17,7 @@ def get_webdriver_chrome() -> webdriver.Chrome:
     # if os.environ.get('HEADLESS'):
     #     chrome_options.add_argument('headless')
 
-    chrome_options.add_argument(f"user-agent={get_latest_user_agents()[1]}")
+    chrome_options.add_argument(f"user-agent={get_user_agent()}")
 
     WEB_DRIVER = webdriver.Chrome(options=chrome_options)
 
@@ -21,10 +29,34 @@ def get_webdriver_chrome() -> webdriver.Chrome:
     return WEB_DRIVER
 
 
+def get_webdriver_low_bandwidth() -> webdriver.Chrome:
+    """Headless Chrome that doesn't download images, media or fonts. The
+    extractors only need the urls found in the DOM"""
+    chrome_options = webdriver.ChromeOptions()
+
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--mute-audio')
+    chrome_options.add_argument('--autoplay-policy=user-gesture-required')
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+    })
+    # the default headless user agent gets flagged as a bot
+    chrome_options.add_argument(f"user-agent={get_user_agent()}")
+
+    WEB_DRIVER = webdriver.Chrome(options=chrome_options)
+
+    WEB_DRIVER.execute_cdp_cmd('Network.enable', {})
+    WEB_DRIVER.execute_cdp_cmd('Network.setBlockedURLs',
+                               {'urls': BLOCKED_URL_PATTERNS})
+
+    return WEB_DRIVER
+
+
 def get_webdriver_firefox() -> webdriver.Firefox:
     firefox_options = webdriver.FirefoxOptions()
 
-    # firefox_options.add_argument(f"user-agent={get_latest_user_agents()[1]}")
+    # firefox_options.add_argument(f"user-agent={get_user_agent()}")
 
     WEB_DRIVER = webdriver.Firefox(options=firefox_options)
 
@@ -42,3 +74,15 @@ def get_webbrowser_brave() -> webdriver.Chrome:
     WEB_DRIVER = webdriver.Chrome(options=brave_options)
 
     return WEB_DRIVER
+
+
+def get_webdriver_attached(debugger_address: str) -> webdriver.Chrome:
+    """Attaches to a long lived Chrome/Brave started with
+    --remote-debugging-port, ex: debugger_address='127.0.0.1:9222'"""
+    chrome_options = webdriver.ChromeOptions()
+
+    chrome_options.debugger_address = debugger_address
+
+    WEB_DRIVER = webdriver.Chrome(options=chrome_options)
+
+    return WEB_DRIVER
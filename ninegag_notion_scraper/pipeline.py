@@ -0,0 +1,148 @@
+"""Runs the scrape and store steps concurrently, linked by bounded queues"""
+
+import time
+import queue
+import logging
+import threading
+from typing import Callable, Generic, Iterable, List, Optional, Tuple, \
+    TypeVar
+
+
+logger = logging.getLogger('app.pipeline')
+
+T = TypeVar('T')
+
+_DONE = object()
+
+
+class Pipeline(Generic[T]):
+    """Feeds the items of a producer through stages, each one running in its
+    own thread. Each stage sees the items in the order they were produced.
+
+    A stage returns False to cancel the pipeline: the producer and the
+    stages before it stop, while the stages after it still finish the items
+    it already handed over. The stages before it may already have
+    processed items produced after the one cancelling, so a check deciding
+    where a run stops belongs in the producer. An exception in any stage
+    stops everything. The bounded queues make a fast stage wait for a
+    slower one instead of buffering without limit.
+
+    Args:
+        producer (Iterable[Iterable[T]]): batches of items to process
+        stages (List[Tuple[str, Callable[[T], bool]]]): named stages
+        queue_size (int): maximum number of items waiting for each stage
+    """
+
+    def __init__(self,
+                 producer: Iterable[Iterable[T]],
+                 stages: List[Tuple[str, Callable[[T], bool]]],
+                 queue_size: int = 32) -> None:
+        self._producer = producer
+        self._stages = stages
+        self._queues: List[queue.Queue] = [
+            queue.Queue(maxsize=queue_size) for _ in stages
+        ]
+        self._lock = threading.Lock()
+        self._stopped_at: Optional[int] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._stopped_at is not None
+
+    def cancel(self, stage_index: Optional[int] = None) -> None:
+        """Cancels the producer and every stage up to stage_index, or the
+        whole pipeline when stage_index is None"""
+        if stage_index is None:
+            stage_index = len(self._stages)
+        with self._lock:
+            if self._stopped_at is None or stage_index > self._stopped_at:
+                self._stopped_at = stage_index
+
+    def _is_cancelled(self, stage_index: int) -> bool:
+        """Whether the stage (-1 being the producer) has to stop"""
+        stopped_at = self._stopped_at
+        return stopped_at is not None and stage_index <= stopped_at
+
+    def run(self) -> None:
+        """Runs the producer in the calling thread until it is exhausted or
+        the pipeline is cancelled, then waits for every stage to finish.
+        Re-raises the first exception raised by a stage"""
+        threads = [
+            threading.Thread(target=self._worker, args=(index,),
+                             name=f"pipeline-{name}", daemon=True)
+            for index, (name, _) in enumerate(self._stages)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for batch in self._producer:
+                for item in batch:
+                    if not self._put(0, item):
+                        break
+                if self._is_cancelled(-1):
+                    logger.debug("Producer stopped by cancellation")
+                    break
+        except BaseException:
+            self.cancel()
+            raise
+        finally:
+            self._put(0, _DONE)
+            for thread in threads:
+                thread.join()
+
+        if self._error:
+            raise self._error
+
+    def _put(self, index: int, item) -> bool:
+        """Puts item in the queue of stage index, giving up once that stage
+        is cancelled, or its feeder unless item is the end marker. Returns
+        whether the item was queued"""
+        while not self._is_cancelled(index) and \
+                (item is _DONE or not self._is_cancelled(index - 1)):
+            try:
+                self._queues[index].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, index: int):
+        while not self._is_cancelled(index):
+            try:
+                return self._queues[index].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _worker(self, index: int) -> None:
+        name, func = self._stages[index]
+        is_last = index == len(self._stages) - 1
+        count = 0
+        busy = 0.0
+
+        try:
+            while (item := self._get(index)) is not _DONE:
+                start = time.perf_counter()
+                keep_going = func(item)
+                busy += time.perf_counter() - start
+                count += 1
+
+                if not keep_going:
+                    logger.debug(f"Pipeline cancelled by stage '{name}'")
+                    self.cancel(index)
+                    break
+
+                if not is_last:
+                    self._put(index + 1, item)
+        except BaseException as error:
+            logger.error(f"Stage '{name}' failed: {error!r}")
+            if self._error is None:
+                self._error = error
+            self.cancel()
+        finally:
+            if not is_last:
+                self._put(index + 1, _DONE)
+            logger.info(f"Stage '{name}' processed {count} items "
+                        f"in {busy:.2f}s")
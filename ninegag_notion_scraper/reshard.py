@@ -0,0 +1,64 @@
+"""Moves the files of the local archive to the configured layout"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from .args import Arguments
+from .env import Environments
+from .infra.repo.storage_layout import StorageLayout
+
+
+logger = logging.getLogger('app.storage')
+
+
+def main(args: Arguments, envs: Environments) -> None:
+    layout = StorageLayout(envs.STORAGE_SHARD_LEVELS)
+    workers = args.workers if args.workers > 1 else 8
+
+    for path in [envs.MEMES_PATH, envs.COVERS_PATH]:
+        start = time.perf_counter()
+        moved = reshard_storage(path, layout, workers)
+        logger.info(f"Moved {moved} files of '{path}' to {layout.levels} "
+                    f"levels in {time.perf_counter() - start:.1f}s")
+
+
+def reshard_storage(root: str, layout: StorageLayout, workers: int) -> int:
+    """Moves every file under root, whatever layout it is in, to where
+    layout puts it, on workers threads. Each file is moved with a single
+    rename, so an interrupted run leaves every file whole and running it
+    again finishes the job. Directories left empty are removed. Returns the
+    number of files moved"""
+    moves: List[Tuple[str, str]] = []
+
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            # also moves the '.part' files and their validators, so the
+            # downloads still resume
+            post_id = file_name.partition('.')[0]
+            target = os.path.join(layout.directory(root, post_id), file_name)
+            if os.path.join(directory, file_name) != target:
+                moves.append((os.path.join(directory, file_name), target))
+
+    logger.info(f"{len(moves)} files of '{root}' to move")
+
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='reshard') as executor:
+        moved = sum(executor.map(lambda x: _move(*x), moves))
+
+    for directory, _, _ in os.walk(root, topdown=False):
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+
+    return moved
+
+
+def _move(source: str, target: str) -> bool:
+    if os.path.exists(target):
+        logger.warning(f"Not moving '{source}', '{target}' already exists")
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.rename(source, target)
+    return True
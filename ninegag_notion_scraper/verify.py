@@ -0,0 +1,115 @@
+"""Checks the local archive against its manifest"""
+
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from .args import Arguments
+from .env import Environments
+from .infra.repo.blob_store import BlobStore
+from .infra.repo.meme_filestorage import PostIDIndex
+from .infra.repo.storage_layout import StorageLayout
+from .infra.repo.storage_manifest import ManifestEntry, StorageManifest
+
+
+logger = logging.getLogger('app.storage')
+
+STAT_WORKERS = 32
+
+
+@dataclass
+class VerifyStats:
+    checked: int = 0
+    hashed: int = 0
+    missing: int = 0
+    corrupt: int = 0
+    unrecorded: int = 0
+
+
+def main(args: Arguments, envs: Environments) -> None:
+    if not envs.STORAGE_MANIFEST_PATH:
+        raise ValueError("STORAGE_MANIFEST_PATH has to be set to verify "
+                         "the local storage")
+
+    workers = args.workers if args.workers > 1 else os.cpu_count() or 1
+    manifest = StorageManifest(envs.STORAGE_MANIFEST_PATH)
+    start = time.perf_counter()
+
+    try:
+        stats = verify_storage(manifest,
+                               [envs.MEMES_PATH, envs.COVERS_PATH],
+                               StorageLayout(envs.STORAGE_SHARD_LEVELS),
+                               workers)
+    finally:
+        manifest.close()
+
+    logger.info(f"Verified {stats.checked} files in "
+                f"{time.perf_counter() - start:.1f}s, {stats.hashed} "
+                f"re-hashed: {stats.missing} missing, {stats.corrupt} "
+                f"corrupt, {stats.unrecorded} not in the manifest")
+
+
+def verify_storage(manifest: StorageManifest, roots: List[str],
+                   layout: StorageLayout, workers: int) -> VerifyStats:
+    """Compares the size and mtime of every recorded file with the
+    manifest. A file of the wrong size is corrupt, while a file with a new
+    mtime is only a suspect: it is re-hashed by a pool of workers
+    processes, and its new mtime recorded if the digest still matches"""
+    stats = VerifyStats()
+    suspects: List[Tuple[ManifestEntry, str, os.stat_result]] = []
+
+    for root in roots:
+        entries = list(manifest.entries(root))
+        paths = [
+            os.path.join(layout.directory(root, x.post_id),
+                         x.post_id + x.extension)
+            for x in entries
+        ]
+
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS) as executor:
+            file_stats = list(executor.map(_stat, paths))
+
+        for entry, path, file_stat in zip(entries, paths, file_stats):
+            stats.checked += 1
+            if file_stat is None:
+                stats.missing += 1
+                logger.warning(f"'{path}' is missing")
+            elif file_stat.st_size != entry.size:
+                stats.corrupt += 1
+                logger.warning(f"'{path}' is {file_stat.st_size} bytes "
+                               f"instead of {entry.size}")
+            elif file_stat.st_mtime_ns != entry.mtime_ns and entry.sha256:
+                suspects.append((entry, path, file_stat))
+
+        recorded = {x.post_id for x in entries}
+        if os.path.isdir(root):
+            stats.unrecorded += len(PostIDIndex.build(root, layout)
+                                    - recorded)
+
+    logger.info(f"Re-hashing {len(suspects)} modified files")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        digests = executor.map(BlobStore.hash_file,
+                               [path for _, path, _ in suspects],
+                               chunksize=16)
+
+        for (entry, path, file_stat), digest in zip(suspects, digests):
+            stats.hashed += 1
+            if digest != entry.sha256:
+                stats.corrupt += 1
+                logger.warning(f"'{path}' doesn't match its sha256")
+                continue
+            manifest.update_stat(entry, file_stat.st_size,
+                                 file_stat.st_mtime_ns)
+
+    return stats
+
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,129 @@
+import os
+import json
+import unittest
+from typing import List
+from unittest import mock
+import httpx
+
+from ninegag_notion_scraper.app.use_cases.cookies import CookiesUseCase
+from ninegag_notion_scraper.infra.repo.meme_ninegag_scraper.feed_http \
+    import NineGagFeedHTTPRepo
+from ninegag_notion_scraper.infra.repo.meme_ninegag_scraper.variants \
+    import VariantSelector
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'feed')
+API_URL = "https://9gag.com/v1/feed-posts/type/hot"
+
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES, name)) as file:
+        return json.load(file)
+
+
+class StubClients:
+    """Stands in for HTTPClients, answering the feed API with the recorded
+    pages: the first without a cursor, the second with the cursor of the
+    first"""
+
+    def __init__(self) -> None:
+        self.requests: List[httpx.Request] = []
+        self.client = httpx.Client(transport=httpx.MockTransport(self._handle))
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        page_1 = load_fixture('hot_page_1.json')
+
+        if str(request.url) == API_URL:
+            return httpx.Response(200, json=page_1)
+        if str(request.url) == f"{API_URL}?{page_1['data']['nextCursor']}":
+            return httpx.Response(200, json=load_fixture('hot_page_2.json'))
+        return httpx.Response(404)
+
+
+class TestNineGagFeedHTTPRepo(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clients = StubClients()
+        self.repo = NineGagFeedHTTPRepo(
+            "https://9gag.com/hot",
+            mock.Mock(spec=CookiesUseCase),
+            user_agent='test',
+            variant_selector=VariantSelector(clients=self.clients),
+            clients=self.clients
+        )
+
+    def tearDown(self) -> None:
+        self.clients.close()
+
+    def test_pages_through_the_feed(self):
+        with self.repo:
+            first = self.repo.get_memes()
+            self.assertEqual(self.repo.next(), 1)
+            second = self.repo.get_memes()
+            self.assertEqual(self.repo.next(), 1)
+
+        self.assertTrue(self.repo.at_end)
+        self.assertEqual([x.post_id for x in first], ['aRGw4Lm', 'a9bZ2Kq'])
+        self.assertEqual([x.post_id for x in second], ['aLa5tPg'])
+        # each page is requested once, get_memes and next share it
+        self.assertEqual(len(self.clients.requests), 2)
+        self.assertEqual(self.clients.requests[0].headers['User-Agent'],
+                         'test')
+
+    def test_decodes_a_photo(self):
+        with self.repo:
+            meme = self.repo.get_memes()[0]
+
+        self.assertEqual(
+            meme.post_title,
+            "When the code works on the first try & you don't know why")
+        self.assertEqual(meme.post_url, "http://9gag.com/gag/aRGw4Lm")
+        self.assertEqual(meme.post_tags, ['programming', 'memes & jokes'])
+        self.assertEqual(
+            meme.post_cover_photo_url,
+            "https://img-9gag-fun.9cache.com/photo/aRGw4Lm_460s.jpg")
+        self.assertEqual(
+            meme.post_file_url,
+            "https://img-9gag-fun.9cache.com/photo/aRGw4Lm_700b.jpg")
+
+    def test_decodes_an_animation(self):
+        with self.repo:
+            meme = self.repo.get_memes()[1]
+
+        self.assertEqual(
+            meme.post_file_url,
+            "https://img-9gag-fun.9cache.com/photo/a9bZ2Kq_460sv.mp4")
+
+    def test_picks_the_variant_of_the_codec_order(self):
+        self.repo.variant_selector = VariantSelector(
+            codec_order=('av1', 'h264'), clients=self.clients)
+
+        with self.repo:
+            meme = self.repo.get_memes()[1]
+
+        self.assertEqual(
+            meme.post_file_url,
+            "https://img-9gag-fun.9cache.com/photo/a9bZ2Kq_460svav1.mp4")
+
+    def test_skips_promoted_posts_and_posts_without_media(self):
+        with self.repo:
+            post_ids = [x.post_id for x in self.repo.get_memes()]
+
+        self.assertNotIn('aPr0m0d', post_ids)
+        self.assertNotIn('aArt1cl', post_ids)
+
+    def test_last_page_ends_the_feed(self):
+        with self.repo:
+            self.repo.next()
+            self.repo.get_memes()
+            self.repo.next()
+            self.assertTrue(self.repo.at_end)
+            self.assertEqual(self.repo.get_memes(), [])
+            self.assertEqual(len(self.clients.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()